@@ -0,0 +1,180 @@
+from __future__ import annotations
+
+import ast
+from collections.abc import Callable
+
+AlertCheck = Callable[[float, float, float, float], bool]
+
+# The variables an alert expression may use, in the order its compiled check
+# takes them.
+ARGS = ('now', 'min', 'max', 'prob')
+COMPARISONS = (ast.Eq, ast.NotEq, ast.Lt, ast.LtE, ast.Gt, ast.GtE)
+# How far past a spawn's max time to look for an alert's trigger time before
+# checking again later, in minutes.
+HORIZON = 24 * 60
+# ** is left out since it can take forever on large enough integers.
+OPERATORS = (
+    ast.Add, ast.Sub, ast.Mult, ast.Div, ast.FloorDiv, ast.Mod, ast.Not,
+    ast.UAdd, ast.USub
+)
+# Trigger times are found to within this many minutes.
+PRECISION = 1 / 600
+
+# Over the life of a tracked spawn, now and prob only ever increase while min
+# and max stay fixed.
+TRENDS = {'now': 1, 'prob': 1, 'min': 0, 'max': 0}
+
+
+def allowed(node: ast.expr) -> bool:
+    if isinstance(node, ast.Name):
+        return node.id in ARGS
+    if isinstance(node, ast.Constant):
+        return type(node.value) in (bool, float, int)
+    if isinstance(node, (ast.BinOp, ast.UnaryOp)):
+        return isinstance(node.op, OPERATORS)
+    if isinstance(node, ast.Compare):
+        return all(isinstance(op, COMPARISONS) for op in node.ops)
+    return isinstance(node, ast.BoolOp)
+
+
+def combine(a: int | None, b: int | None) -> int | None:
+    if a is None or b is None:
+        return None
+    if not a or a == b:
+        return b
+    return a if not b else None
+
+
+def compile_alert(expr: str) -> AlertCheck:
+    # Raises SyntaxError if expr is not an expression at all and ValueError if
+    # it uses anything beyond arithmetic, comparisons and boolean operators on
+    # numbers and ARGS.
+    tree = ast.parse(expr, mode='eval')
+    for node in ast.walk(tree.body):
+        if isinstance(node, ast.expr) and not allowed(node):
+            raise ValueError(f'"{ast.unparse(node)}" is not allowed')
+    args = ast.arguments(
+        posonlyargs=[],
+        args=[ast.arg(arg) for arg in ARGS],
+        kwonlyargs=[],
+        kw_defaults=[],
+        defaults=[]
+    )
+    fn = ast.Expression(ast.Lambda(args, tree.body))
+    ast.fix_missing_locations(fn)
+    return eval(compile(fn, '<alert>', 'eval'), {'__builtins__': {}})
+
+
+def constant(node: ast.expr) -> float | None:
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub):
+        value = constant(node.operand)
+        return None if value is None else -value
+    if (
+        isinstance(node, ast.Constant) and
+        isinstance(node.value, (int, float)) and
+        not isinstance(node.value, bool)
+    ):
+        return node.value
+    return None
+
+
+def direction(expr: str) -> int | None:
+    # 1 if the expression can only go from False to True as time passes, -1 if
+    # it can only go from True to False, 0 if it never changes and None if it
+    # may do anything.
+    try:
+        tree = ast.parse(expr, mode='eval')
+    except SyntaxError:
+        return None
+    return predicate_direction(tree.body)
+
+
+def first_true(
+    holds: Callable[[float], bool], start: float, end: float
+) -> float | None:
+    # Assumes holds only ever goes from False to True between start and end.
+    if holds(start):
+        return start
+    if not holds(end):
+        return None
+    while end - start > PRECISION:
+        mid = (start + end) / 2
+        if holds(mid):
+            end = mid
+        else:
+            start = mid
+    return end
+
+
+def negate(a: int | None) -> int | None:
+    return None if a is None else -a
+
+
+def never(now: float, min_time: float, max_time: float, prob: float) -> bool:
+    return False
+
+
+def predicate_direction(node: ast.expr) -> int | None:
+    if isinstance(node, ast.BoolOp):
+        result = 0
+        for value in node.values:
+            result = combine(result, predicate_direction(value))
+        return result
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Not):
+        return negate(predicate_direction(node.operand))
+    if isinstance(node, ast.Compare):
+        result = 0
+        left = node.left
+        for op, right in zip(node.ops, node.comparators):
+            diff = combine(trend(left), negate(trend(right)))
+            if isinstance(op, (ast.Lt, ast.LtE)):
+                diff = negate(diff)
+            elif not isinstance(op, (ast.Gt, ast.GtE)):
+                return None
+            result = combine(result, diff)
+            left = right
+        return result
+    if isinstance(node, ast.Constant) and isinstance(node.value, bool):
+        return 0
+    return None
+
+
+def scaled(a: int | None, scale: float) -> int | None:
+    if a is None or scale > 0:
+        return a
+    return -a if scale < 0 else 0
+
+
+def trend(node: ast.expr) -> int | None:
+    # Like predicate_direction, but for the numeric value of the expression.
+    if isinstance(node, ast.Name):
+        return TRENDS.get(node.id)
+    if isinstance(node, ast.Constant):
+        value = node.value
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return 0
+        return None
+    if isinstance(node, ast.UnaryOp):
+        if isinstance(node.op, ast.UAdd):
+            return trend(node.operand)
+        if isinstance(node.op, ast.USub):
+            return negate(trend(node.operand))
+        return None
+    if not isinstance(node, ast.BinOp):
+        return None
+    left = trend(node.left)
+    right = trend(node.right)
+    if isinstance(node.op, ast.Add):
+        return combine(left, right)
+    if isinstance(node.op, ast.Sub):
+        return combine(left, negate(right))
+    if isinstance(node.op, (ast.Mult, ast.Div)):
+        # Only scaling by a literal keeps the trend known.
+        if (scale := constant(node.right)) is not None:
+            return scaled(left, scale)
+        if (
+            isinstance(node.op, ast.Mult) and
+            (scale := constant(node.left)) is not None
+        ):
+            return scaled(right, scale)
+    return None
@@ -0,0 +1,75 @@
+# Times State.sorted_tracked, which keeps the board order between refreshes,
+# against sorting every tracked spawn from scratch, and checks that both give
+# the same order. Run from the repository root:
+#   python -m bench.ordering [spawns...]
+from __future__ import annotations
+
+import copy
+import random
+import sys
+import time
+
+from tracker import DEFAULT, State
+
+REFRESHES = 30
+SPAWNS = [1000, 10000, 50000]
+
+
+def make_state(spawns: int, seed: int) -> State:
+    rand = random.Random(seed)
+    # The order only ever moves forward from the time the state is built.
+    now = time.time() / 60
+    config = copy.deepcopy(DEFAULT)
+    for i in range(spawns):
+        min_spawn = rand.randint(30, 600)
+        max_spawn = min_spawn + rand.choice([0, 10, 30])
+        boss = f'Bench {i}'
+        config['bosses'][boss] = {
+            'aliases': [],
+            'spawns': {'Field': {'min': min_spawn, 'max': max_spawn}}
+        }
+        config['tracking'][boss] = {
+            'Field': [
+                rand.uniform(now - 2 * max_spawn, now), rand.choice([0, 5])
+            ]
+        }
+    return State(f'bench-{spawns}', config)
+
+
+def full_sort(state: State) -> list[tuple[str, str]]:
+    return sorted(state.tracked, key=lambda spawn: state.boss_sort_key(*spawn))
+
+
+def main() -> None:
+    counts = [int(arg) for arg in sys.argv[1:]] or SPAWNS
+    mismatches = 0
+    print(f'{"spawns":>8} {"full sort":>12} {"incremental":>12} {"moving":>8}')
+    for count in counts:
+        state = make_state(count, count)
+        state.sorted_tracked()
+        start_time = state.refresh_time
+        full_time = incremental_time = 0.0
+        for minute in range(1, REFRESHES + 1):
+            # One refresh a minute, as with the default auto-refresh.
+            state.refresh_time = start_time + minute
+            state.spawn_cache.clear()
+            start = time.perf_counter()
+            expected = full_sort(state)
+            full_time += time.perf_counter() - start
+            state.spawn_cache.clear()
+            start = time.perf_counter()
+            actual = state.sorted_tracked()
+            incremental_time += time.perf_counter() - start
+            mismatches += expected != actual
+        print(
+            f'{count:>8} {full_time / REFRESHES * 1e3:>10.2f}ms '
+            f'{incremental_time / REFRESHES * 1e3:>10.2f}ms '
+            f'{len(state.moving):>8}'
+        )
+    print(f'mismatches: {mismatches}')
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+# Times what one tracking command costs to persist as the number of guilds
+# grows: rewriting config.json with every guild, as save() used to, against
+# the per-guild journal and SQLite stores. Run from the repository root:
+#   python -m bench.save_cost [guilds...]
+from __future__ import annotations
+
+import copy
+import json
+import os
+import sys
+import tempfile
+import time
+
+from default import CATALOG, DEFAULT
+from storage import GuildStore, SqliteStore, Store, write_text
+
+COMMANDS = 200
+GUILDS = [10, 100, 1000]
+# Rewriting every guild is slow enough that a few runs are plenty.
+REWRITES = 5
+TRACKED = ['Baphomet', 'Eddga', 'Maya', 'Orc Hero', 'Phreeoni']
+
+
+def make_config() -> dict:
+    config = copy.deepcopy(DEFAULT)
+    for boss in TRACKED:
+        config['tracking'][boss] = {
+            loc: [1000.0, 0] for loc in CATALOG[boss]['spawns']
+        }
+    return config
+
+
+def legacy_config() -> dict:
+    # Before the shared catalog every guild held a full copy of it.
+    config = copy.deepcopy(DEFAULT)
+    config['bosses'] = copy.deepcopy(CATALOG)
+    return config
+
+
+def commands(guilds: int) -> list[tuple[str, list, list]]:
+    result = []
+    for i in range(COMMANDS):
+        boss = TRACKED[i % len(TRACKED)]
+        loc = next(iter(CATALOG[boss]['spawns']))
+        result.append(
+            (str(i % guilds), ['tracking', boss, loc], [1000.0 + i, 0])
+        )
+    return result
+
+
+def full_rewrite(path: str, configs: dict) -> float:
+    start = time.perf_counter()
+    for _ in range(REWRITES):
+        write_text(path, json.dumps(configs))
+    return (time.perf_counter() - start) / REWRITES
+
+
+def journal(store: Store, guilds: int) -> tuple[float, float]:
+    # encode() is what runs on the event loop; write_pending() runs on the
+    # store's worker thread.
+    encode_time = write_time = 0.0
+    for guild, path, arg in commands(guilds):
+        start = time.perf_counter()
+        items = store.encode(guild, 'set', path, arg)
+        encode_time += time.perf_counter() - start
+        start = time.perf_counter()
+        store.write_pending(items)
+        write_time += time.perf_counter() - start
+    return encode_time / COMMANDS, write_time / COMMANDS
+
+
+def main() -> None:
+    counts = [int(arg) for arg in sys.argv[1:]] or GUILDS
+    print(
+        f'{"guilds":>8} {"config.json":>12} '
+        f'{"journal loop":>13} {"write":>9} '
+        f'{"sqlite loop":>12} {"write":>9}'
+    )
+    for count in counts:
+        with tempfile.TemporaryDirectory() as directory:
+            legacy = {str(i): legacy_config() for i in range(count)}
+            full_time = full_rewrite(
+                os.path.join(directory, 'config.json'), legacy
+            )
+            configs = {str(i): make_config() for i in range(count)}
+            files = GuildStore(os.path.join(directory, 'guilds'), 0)
+            files.load()
+            for guild, config in configs.items():
+                files.record(guild, 'set', [], config)
+            files.close(configs)
+            journal_times = journal(files, count)
+            db = SqliteStore(os.path.join(directory, 'tracker.db'), 0)
+            for guild, config in configs.items():
+                db.record(guild, 'set', [], config)
+            sqlite_times = journal(db, count)
+            db.close(configs)
+        print(
+            f'{count:>8} {full_time * 1e3:>10.3f}ms '
+            f'{journal_times[0] * 1e3:>11.3f}ms '
+            f'{journal_times[1] * 1e3:>7.3f}ms '
+            f'{sqlite_times[0] * 1e3:>10.3f}ms '
+            f'{sqlite_times[1] * 1e3:>7.3f}ms'
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -224,6 +224,8 @@ DEFAULT_BOSSES = [
     ('Zealotus', 'zherlthsh', ('Glast Heim', 60, 90))
 ]
 
+CATALOG = {}
+
 DEFAULT = {
     'alerts': [],
     'auto-refresh': 1,
@@ -232,15 +234,19 @@ DEFAULT = {
     'messages': [],
     'utc-offset': 0,
     'bosses': {},
-    'tracking': {}
+    'tracking': {},
+    'version': 2
 }
 
 for entries in DEFAULT_BOSSES:
     name = entries[0]
-    aliases = []
+    aliases = set()
+    if ' ' in name:
+        aliases.add(name.lower().replace(' ', ''))
+        aliases.add(''.join(s[0].lower() for s in name.split()))
     i = 1
     while type(entries[i]) == str:
-        aliases.append(entries[i])
+        aliases.add(entries[i])
         i += 1
 
     spawns = {}
@@ -254,6 +260,6 @@ for entries in DEFAULT_BOSSES:
                 spawns[dupe_map_name] = {'min': min_spawn, 'max': max_spawn}
         else:
             spawns[map_name] = {'min': min_spawn, 'max': max_spawn}
-    DEFAULT['bosses'][name] = {
+    CATALOG[name] = {
         'aliases': sorted(aliases, key=lambda x: (len(x), x)), 'spawns': spawns
     }
@@ -0,0 +1,72 @@
+from __future__ import annotations
+
+SpawnConfig = dict[str, int]
+BossConfig = dict[str, list[str] | dict[str, SpawnConfig]]
+
+
+class Spawn:
+    __slots__ = ('min', 'max')
+    min: int
+    max: int
+
+    @staticmethod
+    def from_config(config: SpawnConfig) -> Spawn:
+        return Spawn(config['min'], config['max'])
+
+    def __init__(self, min_spawn: int, max_spawn: int) -> None:
+        self.min = min_spawn
+        self.max = max_spawn
+
+    def to_config(self) -> SpawnConfig:
+        return {'min': self.min, 'max': self.max}
+
+
+class Boss:
+    __slots__ = ('aliases', 'spawns')
+    aliases: list[str]
+    spawns: dict[str, Spawn]
+
+    @staticmethod
+    def from_config(config: BossConfig) -> Boss:
+        return Boss(
+            list(config['aliases']),
+            {
+                loc: Spawn.from_config(spawn)
+                for loc, spawn in config['spawns'].items()
+            }
+        )
+
+    def __init__(self, aliases: list[str], spawns: dict[str, Spawn]) -> None:
+        self.aliases = aliases
+        self.spawns = spawns
+
+    def copy(self) -> Boss:
+        return Boss(
+            list(self.aliases),
+            {loc: Spawn(s.min, s.max) for loc, s in self.spawns.items()}
+        )
+
+    def to_config(self) -> BossConfig:
+        return {
+            'aliases': list(self.aliases),
+            'spawns': {
+                loc: spawn.to_config() for loc, spawn in self.spawns.items()
+            }
+        }
+
+
+class Tracked:
+    __slots__ = ('tod', 'window', 'pending')
+    tod: float
+    window: float
+    # Pending alerts, as a bitmask of alert IDs.
+    pending: int
+
+    def __init__(self, tod: float, window: float, pending: int = 0) -> None:
+        self.tod = tod
+        self.window = window
+        self.pending = pending
+
+    def to_config(self) -> list[float]:
+        return [self.tod, self.window]
+
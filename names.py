@@ -0,0 +1,257 @@
+from __future__ import annotations
+
+import heapq
+from collections import Counter, OrderedDict
+from collections.abc import Iterable
+
+# How many recent lookups are kept. Each is dropped as soon as a name under it
+# changes.
+CACHE_SIZE = 64
+# At most this many bosses are suggested for a name that matches none.
+SUGGESTIONS = 5
+
+
+class TrieNode:
+    __slots__ = ('bosses', 'children', 'exact')
+    # Every boss with a name at or under this node, with how many of its names
+    # are.
+    bosses: dict[str, int]
+    children: dict[str, TrieNode]
+    # Bosses with a name ending at this node.
+    exact: set[str]
+
+    def __init__(self) -> None:
+        self.bosses = {}
+        self.children = {}
+        self.exact = set()
+
+
+class NameIndex:
+    # The names containing each trigram of their padded form.
+    grams: dict[str, set[str]]
+    root: TrieNode
+
+    @staticmethod
+    def from_names(names: Iterable[tuple[str, str]]) -> NameIndex:
+        index = NameIndex()
+        for name, boss in names:
+            index.add(name, boss)
+        return index
+
+    def __init__(self) -> None:
+        self.grams = {}
+        self.root = TrieNode()
+
+    def add(self, name: str, boss: str) -> None:
+        path = [self.root]
+        for c in name:
+            path.append(path[-1].children.setdefault(c, TrieNode()))
+        if boss in path[-1].exact:
+            return
+        if not path[-1].exact:
+            for gram in trigrams(name):
+                self.grams.setdefault(gram, set()).add(name)
+        path[-1].exact.add(boss)
+        for node in path:
+            node.bosses[boss] = node.bosses.get(boss, 0) + 1
+
+    def exact(self, name: str) -> set[str]:
+        node = self.find(name)
+        return set() if node is None else node.exact
+
+    def find(self, name: str) -> TrieNode | None:
+        node = self.root
+        for c in name:
+            if (node := node.children.get(c)) is None:
+                break
+        return node
+
+    def ranked(self, name: str) -> list[tuple[int, int, str]]:
+        # Names that start with something close to name, as (edits, -shared
+        # trigrams, name).
+        max_edits = 1 if len(name) < 10 else 2
+        # Past this length, a prefix is too long to be within max_edits.
+        length = len(name) + max_edits
+        grams = trigrams(name)
+        shared = Counter()
+        for gram in grams:
+            shared.update(self.grams.get(gram, ()))
+        # A name within max_edits still shares all the trigrams that no edit
+        # touched, and one edit touches at most four.
+        need = max(1, len(grams) - 4 * max_edits)
+        candidates = [c for c, count in shared.items() if count >= need]
+        distances = prefix_distances(
+            name, sorted({c[:length] for c in candidates}), max_edits
+        )
+        ranked = []
+        for candidate in candidates:
+            if (distance := distances[candidate[:length]]) <= max_edits:
+                ranked.append((distance, -shared[candidate], candidate))
+        return ranked
+
+    def remove(self, name: str, boss: str) -> None:
+        path = [self.root]
+        for c in name:
+            path.append(path[-1].children[c])
+        path[-1].exact.remove(boss)
+        if not path[-1].exact:
+            for gram in trigrams(name):
+                names = self.grams[gram]
+                names.remove(name)
+                if not names:
+                    del self.grams[gram]
+        for node in path:
+            if node.bosses[boss] == 1:
+                del node.bosses[boss]
+            else:
+                node.bosses[boss] -= 1
+        # Prune the branch the name no longer needs.
+        for i in range(len(name), 0, -1):
+            if path[i].bosses:
+                break
+            del path[i - 1].children[name[i - 1]]
+
+
+class LayeredIndex:
+    # A guild's names: those of its own bosses over a shared index, less the
+    # shared bosses it has changed or removed.
+    base: NameIndex
+    cache: OrderedDict[str, frozenset[str]]
+    hidden: set[str]
+    own: NameIndex
+
+    def __init__(self, base: NameIndex, hidden: set[str]) -> None:
+        self.base = base
+        self.cache = OrderedDict()
+        self.hidden = hidden
+        self.own = NameIndex()
+
+    def add(self, name: str, boss: str) -> None:
+        self.hide(boss)
+        self.own.add(name, boss)
+        self.invalidate(name)
+
+    def bosses(self, name: str) -> set[str]:
+        return (self.base.exact(name) - self.hidden) | self.own.exact(name)
+
+    def hide(self, boss: str) -> None:
+        if boss in self.base.root.bosses and boss not in self.hidden:
+            self.hidden.add(boss)
+            # Lookups for any prefix of any of its names could have it.
+            self.cache.clear()
+
+    def invalidate(self, name: str) -> None:
+        # Only lookups for prefixes of name can see it.
+        for i in range(len(name) + 1):
+            self.cache.pop(name[:i], None)
+
+    def lookup(self, name: str) -> frozenset[str]:
+        # The bosses with exactly this name if there are any, otherwise every
+        # boss with a name starting with it.
+        if (bosses := self.cache.get(name)) is not None:
+            self.cache.move_to_end(name)
+            return bosses
+        base = self.base.find(name)
+        own = self.own.find(name)
+        found = set() if base is None else base.exact - self.hidden
+        if own is not None:
+            found.update(own.exact)
+        if not found:
+            if base is not None:
+                found = base.bosses.keys() - self.hidden
+            if own is not None:
+                found.update(own.bosses)
+        self.cache[name] = bosses = frozenset(found)
+        if len(self.cache) > CACHE_SIZE:
+            self.cache.popitem(last=False)
+        return bosses
+
+    def remove(self, name: str, boss: str) -> None:
+        if boss in self.own.exact(name):
+            self.own.remove(name, boss)
+            self.invalidate(name)
+        else:
+            # One of the shared bosses, none of whose names apply any more.
+            self.hide(boss)
+
+    def suggest(self, name: str) -> list[str]:
+        # Bosses with a name that starts with something close to name, closest
+        # first.
+        ranked = self.base.ranked(name) + self.own.ranked(name)
+        heapq.heapify(ranked)
+        bosses = []
+        while ranked and len(bosses) < SUGGESTIONS:
+            _, _, candidate = heapq.heappop(ranked)
+            for boss in sorted(self.bosses(candidate)):
+                if boss not in bosses:
+                    bosses.append(boss)
+        return bosses[:SUGGESTIONS]
+
+
+def prefix_distances(
+    query: str, names: list[str], limit: int
+) -> dict[str, int]:
+    # For each name, the edits needed to turn query into some prefix of it,
+    # counting a swap of neighbouring characters as one. Anything over limit
+    # comes back as limit + 1. names must be sorted, so that each shares the
+    # columns of the distance table already computed for its common prefix
+    # with the one before.
+    over = limit + 1
+    columns = [[min(i, over) for i in range(len(query) + 1)]]
+    # The best distance to any prefix up to each column.
+    best = [columns[0][-1]]
+    path = ''
+    distances = {}
+    for name in names:
+        common = 0
+        for a, b in zip(path, name):
+            if a != b:
+                break
+            common += 1
+        del columns[common + 1:]
+        del best[common + 1:]
+        path = name[:common]
+        for j in range(common + 1, len(name) + 1):
+            column = table_column(query, name, j, columns, limit)
+            if min(column) > limit:
+                # Longer prefixes only get further away.
+                break
+            columns.append(column)
+            best.append(min(best[-1], column[-1]))
+            path = name[:j]
+        distances[name] = best[-1]
+    return distances
+
+
+def table_column(
+    query: str, name: str, j: int, columns: list[list[int]], limit: int
+) -> list[int]:
+    # The distances from each prefix of query to name[:j].
+    over = limit + 1
+    d = name[j - 1]
+    prev = columns[j - 1]
+    column = [over] * (len(query) + 1)
+    column[0] = min(j, over)
+    # Cells further than limit from the diagonal are always over it.
+    for i in range(max(1, j - limit), min(len(query), j + limit) + 1):
+        c = query[i - 1]
+        # Comparisons rather than min(), which is slower on this hot path.
+        cost = prev[i - 1] if c == d else prev[i - 1] + 1
+        if prev[i] < cost:
+            cost = prev[i] + 1
+        if column[i - 1] < cost:
+            cost = column[i - 1] + 1
+        if (
+            i > 1 and j > 1 and c == name[j - 2] and query[i - 2] == d and
+            columns[j - 2][i - 2] < cost
+        ):
+            cost = columns[j - 2][i - 2] + 1
+        column[i] = cost if cost < over else over
+    return column
+
+
+def trigrams(name: str) -> set[str]:
+    # Padded only in front, so a name's trigrams include those of each of its
+    # prefixes.
+    padded = f'  {name}'
+    return {padded[i:i + 3] for i in range(len(name))}
@@ -0,0 +1,90 @@
+from __future__ import annotations
+
+import asyncio
+import heapq
+import time
+from collections.abc import Awaitable, Callable
+
+# Guilds due within this many seconds of the earliest due guild are refreshed
+# in the same batch, slightly early.
+TICK = 1.0
+
+
+class RefreshScheduler:
+    callback: Callable[[str], Awaitable[None]]
+    due: dict[str, float]
+    heap: list[tuple[float, str]]
+    lag: float
+    last_batch: int
+    running: set[asyncio.Task]
+    task: asyncio.Task | None
+    wakeup: asyncio.Event | None
+
+    def __init__(self, callback: Callable[[str], Awaitable[None]]) -> None:
+        self.callback = callback
+        self.due = {}
+        self.heap = []
+        self.lag = 0.0
+        self.last_batch = 0
+        self.running = set()
+        self.task = None
+        self.wakeup = None
+
+    @property
+    def depth(self) -> int:
+        return len(self.due)
+
+    def is_stale(self, when: float, guild: str) -> bool:
+        # Entries superseded by a later schedule() are discarded lazily.
+        return self.due.get(guild) != when
+
+    def pop_due(self, now: float) -> list[str]:
+        batch = []
+        lag = 0.0
+        while self.heap and self.heap[0][0] <= now + TICK:
+            when, guild = heapq.heappop(self.heap)
+            if self.is_stale(when, guild):
+                continue
+            del self.due[guild]
+            batch.append(guild)
+            lag = max(lag, now - when)
+        self.lag = lag
+        self.last_batch = len(batch)
+        return batch
+
+    async def run(self) -> None:
+        while True:
+            self.wakeup.clear()
+            while self.heap and self.is_stale(*self.heap[0]):
+                heapq.heappop(self.heap)
+            if not self.heap:
+                await self.wakeup.wait()
+                continue
+            delay = self.heap[0][0] - time.time()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            for guild in self.pop_due(time.time()):
+                # Each guild refreshes under its own lock, so a slow guild
+                # does not hold up the rest of the batch.
+                task = asyncio.create_task(self.callback(guild))
+                self.running.add(task)
+                task.add_done_callback(self.running.discard)
+
+    def schedule(self, guild: str, when: float) -> None:
+        self.due[guild] = when
+        heapq.heappush(self.heap, (when, guild))
+        if self.wakeup and self.heap[0] == (when, guild):
+            self.wakeup.set()
+
+    def start(self) -> None:
+        if self.task:
+            return
+        self.wakeup = asyncio.Event()
+        self.task = asyncio.create_task(self.run())
+
+    def unschedule(self, guild: str) -> None:
+        self.due.pop(guild, None)
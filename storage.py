@@ -0,0 +1,546 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import sqlite3
+import sys
+import traceback
+from abc import ABC, abstractmethod
+from collections.abc import Awaitable
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+
+GuildConfig = dict[str, Any]
+Path = list[str | int]
+Statement = tuple[str, tuple]
+
+GUILD_COLUMNS = {
+    'alert-role': 'alert_role',
+    'auto-refresh': 'auto_refresh',
+    'channel': 'channel',
+    'expire': 'expire',
+    'utc-offset': 'utc_offset',
+    'version': 'version',
+    # Columns added later go last, matching where ALTER TABLE puts them.
+    'adaptive-refresh': 'adaptive_refresh'
+}
+JOURNAL = 'journal.jsonl'
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS guilds (
+    id TEXT PRIMARY KEY,
+    alert_role INTEGER,
+    auto_refresh INTEGER,
+    channel INTEGER,
+    expire INTEGER,
+    utc_offset INTEGER,
+    version INTEGER,
+    adaptive_refresh INTEGER
+);
+CREATE TABLE IF NOT EXISTS alerts (
+    guild TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    expr TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS alerts_guild ON alerts (guild, position);
+CREATE TABLE IF NOT EXISTS editors (
+    guild TEXT NOT NULL,
+    member INTEGER NOT NULL,
+    PRIMARY KEY (guild, member)
+);
+CREATE TABLE IF NOT EXISTS bosses (
+    guild TEXT NOT NULL,
+    boss TEXT NOT NULL,
+    -- NULL when the guild removed this boss from the shared catalog.
+    aliases TEXT,
+    PRIMARY KEY (guild, boss)
+);
+CREATE TABLE IF NOT EXISTS spawns (
+    guild TEXT NOT NULL,
+    boss TEXT NOT NULL,
+    loc TEXT NOT NULL,
+    min INTEGER NOT NULL,
+    max INTEGER NOT NULL,
+    PRIMARY KEY (guild, boss, loc)
+);
+CREATE TABLE IF NOT EXISTS tracked (
+    guild TEXT NOT NULL,
+    boss TEXT NOT NULL,
+    loc TEXT NOT NULL,
+    tod REAL NOT NULL,
+    window REAL,
+    PRIMARY KEY (guild, boss, loc)
+);
+'''
+SEQ_KEY = 'journal-seq'
+
+
+def apply_entry(
+    configs: dict[str, GuildConfig],
+    guild: str,
+    op: str,
+    path: Path,
+    arg: Any
+) -> None:
+    if not path:
+        configs[guild] = arg
+        return
+    parent = configs[guild]
+    for key in path[:-1]:
+        parent = parent.setdefault(key, {}) if op == 'set' else parent[key]
+    key = path[-1]
+    if op == 'set':
+        parent[key] = arg
+    elif op == 'del':
+        del parent[key]
+    elif op == 'append':
+        parent[key].append(arg)
+    elif op == 'remove':
+        parent[key].remove(arg)
+    elif op == 'move':
+        parent[arg] = parent.pop(key)
+    else:
+        raise ValueError(f'unrecognized journal operation "{op}"')
+
+
+def to_json(value: Any) -> Any:
+    # Live configs may hold objects that know their own JSON form.
+    if not hasattr(value, 'to_config'):
+        raise TypeError(f'{type(value).__name__} is not JSON serializable')
+    return value.to_config()
+
+
+def write_text(path: str, text: str) -> None:
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w') as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+class Store(ABC):
+    executor: ThreadPoolExecutor
+    # A batch whose write failed, retried ahead of the next one.
+    failed: list
+    flush_handle: asyncio.TimerHandle | None
+    flush_interval: float
+    pending: list
+
+    def __init__(self, flush_interval: float) -> None:
+        # A single worker keeps writes in the order they were recorded.
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.failed = []
+        self.flush_handle = None
+        self.flush_interval = flush_interval
+        self.pending = []
+
+    def cancel_flush(self) -> None:
+        if self.flush_handle:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+
+    @abstractmethod
+    def close(self, configs: dict[str, GuildConfig]) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    def compact(self, configs: dict[str, GuildConfig]) -> Awaitable[None]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def encode(self, guild: str, op: str, path: Path, arg: Any) -> list:
+        raise NotImplementedError
+
+    def flush(self) -> Awaitable[None]:
+        self.flush_handle = None
+        items = self.pending
+        self.pending = []
+        future = asyncio.get_running_loop().run_in_executor(
+            self.executor, self.write, items
+        )
+        future.add_done_callback(self.flushed)
+        return future
+
+    def flushed(self, future: asyncio.Future) -> None:
+        if future.cancelled() or not (e := future.exception()):
+            return
+        print(
+            ''.join(traceback.format_exception(e)), file=sys.stderr, end=''
+        )
+        # Nothing else may be recorded for a while, so retry on a timer.
+        self.schedule_flush(asyncio.get_running_loop())
+
+    @abstractmethod
+    def load(self, legacy_path: str | None = None) -> dict[str, GuildConfig]:
+        raise NotImplementedError
+
+    def record(
+        self, guild: str, op: str, path: Path, arg: Any = None
+    ) -> None:
+        self.pending.extend(self.encode(guild, op, path, arg))
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # Before the client starts there is no loop to block, so write
+            # right away.
+            self.write_pending(self.pending)
+            self.pending = []
+            return
+        self.schedule_flush(loop)
+
+    def schedule_flush(self, loop: asyncio.AbstractEventLoop) -> None:
+        if not self.flush_handle:
+            self.flush_handle = loop.call_later(
+                self.flush_interval, self.flush
+            )
+
+    def write(self, items: list) -> None:
+        # Runs on the worker, which keeps a failed batch ahead of anything
+        # recorded after it.
+        items = self.failed + items
+        self.failed = []
+        try:
+            self.write_pending(items)
+        except Exception:
+            self.failed = items
+            raise
+
+    @abstractmethod
+    def write_pending(self, items: list) -> None:
+        raise NotImplementedError
+
+
+class GuildStore(Store):
+    directory: str
+    dirty: set[str]
+    pending: list[str]
+    seq: int
+
+    def __init__(self, directory: str, flush_interval: float) -> None:
+        super().__init__(flush_interval)
+        self.directory = directory
+        self.dirty = set()
+        self.seq = 0
+
+    @property
+    def journal_path(self) -> str:
+        return os.path.join(self.directory, JOURNAL)
+
+    def close(self, configs: dict[str, GuildConfig]) -> None:
+        self.cancel_flush()
+        self.executor.shutdown(wait=True)
+        self.write_compaction(*self.take_compaction(configs))
+
+    def compact(self, configs: dict[str, GuildConfig]) -> Awaitable[None]:
+        return asyncio.get_running_loop().run_in_executor(
+            self.executor, self.write_compaction, *self.take_compaction(configs)
+        )
+
+    def encode(self, guild: str, op: str, path: Path, arg: Any) -> list[str]:
+        self.seq += 1
+        self.dirty.add(guild)
+        return [json.dumps([self.seq, guild, op, path, arg]) + '\n']
+
+    def load(self, legacy_path: str | None = None) -> dict[str, GuildConfig]:
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+            if legacy_path and os.path.exists(legacy_path):
+                self.migrate(legacy_path)
+        configs = {}
+        guild_seqs = {}
+        for filename in os.listdir(self.directory):
+            guild, ext = os.path.splitext(filename)
+            if ext != '.json':
+                continue
+            with open(os.path.join(self.directory, filename), 'r') as f:
+                configs[guild] = json.load(f)
+            guild_seqs[guild] = configs[guild].pop(SEQ_KEY, 0)
+            self.seq = max(self.seq, guild_seqs[guild])
+        self.replay(configs, guild_seqs)
+        return configs
+
+    def migrate(self, legacy_path: str) -> None:
+        with open(legacy_path, 'r') as f:
+            legacy_config = json.load(f)
+        for guild, config in legacy_config.items():
+            write_text(self.path(guild), json.dumps(config))
+
+    def path(self, guild: str) -> str:
+        return os.path.join(self.directory, f'{guild}.json')
+
+    def replay(
+        self, configs: dict[str, GuildConfig], guild_seqs: dict[str, int]
+    ) -> None:
+        if not os.path.exists(self.journal_path):
+            return
+        with open(self.journal_path, 'r') as f:
+            for line in f:
+                try:
+                    seq, guild, op, path, arg = json.loads(line)
+                except ValueError:
+                    # A torn final line from a crash mid-append.
+                    break
+                self.seq = max(self.seq, seq)
+                if seq <= guild_seqs.get(guild, 0):
+                    continue
+                apply_entry(configs, guild, op, path, arg)
+                self.dirty.add(guild)
+
+    def take_compaction(
+        self, configs: dict[str, GuildConfig]
+    ) -> tuple[list[str], dict[str, str]]:
+        # Serialize here rather than in the executor so the snapshots are
+        # consistent with the pending journal entries.
+        snapshots = {
+            # Shallow copy so the sequence number stays out of the live config.
+            guild: json.dumps(
+                {**configs[guild], SEQ_KEY: self.seq}, default=to_json
+            )
+            for guild in self.dirty
+        }
+        self.dirty.clear()
+        lines = self.pending
+        self.pending = []
+        return lines, snapshots
+
+    def write_compaction(
+        self, lines: list[str], snapshots: dict[str, str]
+    ) -> None:
+        # Entries covered by the snapshots are still appended first so that a
+        # crash before every snapshot is written loses nothing.
+        try:
+            self.write(lines)
+            for guild, text in snapshots.items():
+                write_text(self.path(guild), text)
+        except Exception:
+            # The journal still holds their entries, so snapshot them again
+            # next time rather than truncating it.
+            self.dirty.update(snapshots)
+            raise
+        open(self.journal_path, 'w').close()
+
+    def write_pending(self, items: list[str]) -> None:
+        if not items:
+            return
+        with open(self.journal_path, 'a') as f:
+            f.write(''.join(items))
+
+
+class SqliteStore(Store):
+    conn: sqlite3.Connection
+    # A file backend directory to import from when the database is empty.
+    guild_dir: str | None
+    pending: list[Statement]
+
+    @staticmethod
+    def boss_statements(
+        guild: str, boss: str, config: GuildConfig | None
+    ) -> list[Statement]:
+        statements = SqliteStore.delete_statements(
+            guild, ('bosses', 'spawns'), 'boss = ?', (boss,)
+        )
+        statements.append((
+            'INSERT INTO bosses VALUES (?, ?, ?)',
+            (guild, boss, config and json.dumps(config['aliases']))
+        ))
+        for loc, spawn in (config['spawns'] if config else {}).items():
+            statements.append((
+                'INSERT INTO spawns VALUES (?, ?, ?, ?, ?)',
+                (guild, boss, loc, spawn['min'], spawn['max'])
+            ))
+        return statements
+
+    @staticmethod
+    def delete_statements(
+        guild: str, tables: tuple[str, ...], where: str, params: tuple
+    ) -> list[Statement]:
+        return [
+            (f'DELETE FROM {table} WHERE guild = ? AND {where}',
+             (guild, *params))
+            for table in tables
+        ]
+
+    @staticmethod
+    def guild_statements(guild: str, config: GuildConfig) -> list[Statement]:
+        statements = SqliteStore.delete_statements(
+            guild,
+            ('alerts', 'editors', 'bosses', 'spawns', 'tracked'),
+            '1',
+            ()
+        )
+        statements.append((
+            f'INSERT OR REPLACE INTO guilds VALUES '
+            f'(?{", ?" * len(GUILD_COLUMNS)})',
+            (guild, *(config.get(key) for key in GUILD_COLUMNS))
+        ))
+        for position, expr in enumerate(config['alerts']):
+            statements.append((
+                'INSERT INTO alerts VALUES (?, ?, ?)', (guild, position, expr)
+            ))
+        for member in config['editors']:
+            statements.append((
+                'INSERT OR IGNORE INTO editors VALUES (?, ?)', (guild, member)
+            ))
+        for boss, boss_config in config['bosses'].items():
+            statements.extend(
+                SqliteStore.boss_statements(guild, boss, boss_config)
+            )
+        for boss, locs in config['tracking'].items():
+            for loc, (tod, window) in locs.items():
+                statements.append((
+                    'INSERT INTO tracked VALUES (?, ?, ?, ?, ?)',
+                    (guild, boss, loc, tod, window)
+                ))
+        return statements
+
+    def __init__(
+        self,
+        db_path: str,
+        flush_interval: float,
+        guild_dir: str | None = None
+    ) -> None:
+        super().__init__(flush_interval)
+        self.guild_dir = guild_dir
+        # Only ever used by one thread at a time: the loader before the
+        # client starts, and the executor's single worker afterwards.
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.executescript(SCHEMA)
+        columns = {
+            row[1] for row in self.conn.execute('PRAGMA table_info(guilds)')
+        }
+        for column in GUILD_COLUMNS.values():
+            if column not in columns:
+                self.conn.execute(
+                    f'ALTER TABLE guilds ADD COLUMN {column} INTEGER'
+                )
+
+    def close(self, configs: dict[str, GuildConfig]) -> None:
+        self.cancel_flush()
+        self.executor.shutdown(wait=True)
+        self.write(self.pending)
+        self.pending = []
+        self.conn.close()
+
+    def compact(self, configs: dict[str, GuildConfig]) -> Awaitable[None]:
+        # SQLite maintains its own journal; just make sure nothing is pending.
+        return self.flush()
+
+    def encode(
+        self, guild: str, op: str, path: Path, arg: Any
+    ) -> list[Statement]:
+        if not path:
+            return self.guild_statements(guild, arg)
+        key = path[0]
+        if key in GUILD_COLUMNS:
+            return [(
+                f'UPDATE guilds SET {GUILD_COLUMNS[key]} = ? WHERE id = ?',
+                (arg, guild)
+            )]
+        if key == 'alerts':
+            if op == 'append':
+                return [(
+                    'INSERT INTO alerts SELECT ?, COUNT(*), ? FROM alerts '
+                    'WHERE guild = ?',
+                    (guild, arg, guild)
+                )]
+            return [
+                (
+                    'DELETE FROM alerts WHERE guild = ? AND position = ?',
+                    (guild, path[1])
+                ),
+                (
+                    'UPDATE alerts SET position = position - 1 '
+                    'WHERE guild = ? AND position > ?',
+                    (guild, path[1])
+                )
+            ]
+        if key == 'editors':
+            if op == 'append':
+                return [(
+                    'INSERT OR IGNORE INTO editors VALUES (?, ?)', (guild, arg)
+                )]
+            return self.delete_statements(
+                guild, ('editors',), 'member = ?', (arg,)
+            )
+        if key == 'bosses':
+            if op == 'set':
+                return self.boss_statements(guild, path[1], arg)
+            return self.delete_statements(
+                guild, ('bosses', 'spawns'), 'boss = ?', (path[1],)
+            )
+        if key == 'tracking':
+            return self.encode_tracking(guild, op, path[1:], arg)
+        return []
+
+    def encode_tracking(
+        self, guild: str, op: str, path: Path, arg: Any
+    ) -> list[Statement]:
+        where = 'boss = ?' if len(path) == 1 else 'boss = ? AND loc = ?'
+        column = 'boss' if len(path) == 1 else 'loc'
+        if op == 'set':
+            boss, loc = path
+            return [(
+                'INSERT OR REPLACE INTO tracked VALUES (?, ?, ?, ?, ?)',
+                (guild, boss, loc, *arg)
+            )]
+        if op == 'move':
+            return [(
+                f'UPDATE tracked SET {column} = ? WHERE guild = ? AND {where}',
+                (arg, guild, *path)
+            )]
+        return self.delete_statements(guild, ('tracked',), where, tuple(path))
+
+    def load(self, legacy_path: str | None = None) -> dict[str, GuildConfig]:
+        cursor = self.conn.cursor()
+        if not cursor.execute('SELECT 1 FROM guilds LIMIT 1').fetchone():
+            if self.guild_dir and os.path.isdir(self.guild_dir):
+                # The file backend only migrated from the legacy file once,
+                # so its snapshots and journal are the newer copy.
+                configs = GuildStore(self.guild_dir, self.flush_interval).load()
+                self.write_pending([
+                    statement
+                    for guild, config in configs.items()
+                    for statement in self.guild_statements(guild, config)
+                ])
+                return configs
+            if legacy_path and os.path.exists(legacy_path):
+                # The caller records each guild once it is upgraded, which
+                # writes it to the database.
+                with open(legacy_path, 'r') as f:
+                    return json.load(f)
+        configs = {}
+        for guild, *values in cursor.execute('SELECT * FROM guilds'):
+            config = {'alerts': [], 'editors': [], 'bosses': {}, 'tracking': {}}
+            for key, value in zip(GUILD_COLUMNS, values):
+                if value is not None:
+                    config[key] = value
+            configs[guild] = config
+        for guild, expr in cursor.execute(
+            'SELECT guild, expr FROM alerts ORDER BY guild, position'
+        ):
+            configs[guild]['alerts'].append(expr)
+        for guild, member in cursor.execute('SELECT * FROM editors'):
+            configs[guild]['editors'].append(member)
+        for guild, boss, aliases in cursor.execute('SELECT * FROM bosses'):
+            configs[guild]['bosses'][boss] = aliases and {
+                'aliases': json.loads(aliases), 'spawns': {}
+            }
+        for guild, boss, loc, min_spawn, max_spawn in cursor.execute(
+            'SELECT * FROM spawns'
+        ):
+            configs[guild]['bosses'][boss]['spawns'][loc] = {
+                'min': min_spawn, 'max': max_spawn
+            }
+        for guild, boss, loc, tod, window in cursor.execute(
+            'SELECT * FROM tracked'
+        ):
+            configs[guild]['tracking'].setdefault(boss, {})[loc] = [
+                tod, window
+            ]
+        return configs
+
+    def write_pending(self, items: list[Statement]) -> None:
+        if not items:
+            return
+        with self.conn:
+            for sql, params in items:
+                self.conn.execute(sql, params)
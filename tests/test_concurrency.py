@@ -0,0 +1,59 @@
+import asyncio
+import time
+from datetime import datetime
+from types import SimpleNamespace
+
+import tracker
+
+
+def message(guild, content):
+    return SimpleNamespace(
+        author=SimpleNamespace(id=1, name='u'),
+        channel=None,
+        content=content,
+        created_at=datetime.utcnow(),
+        guild=guild
+    )
+
+
+def test_commands_serialize_per_guild_only(monkeypatch):
+    monkeypatch.setattr(tracker.store, 'record', lambda *args: None)
+    monkeypatch.setattr(tracker, 'global_config', {})
+    monkeypatch.setattr(tracker, 'guild_to_state', {})
+    active = {}
+    overlap = []
+    serial = []
+    finished = {}
+
+    async def probe(state, args):
+        active[state.guild_id] = active.get(state.guild_id, 0) + 1
+        overlap.append(sum(active.values()))
+        serial.append(active[state.guild_id] == 1)
+        # Guild 2 stands in for a guild with a slow refresh.
+        await asyncio.sleep(0.3 if state.guild_id == '2' else 0.01)
+        active[state.guild_id] -= 1
+        finished.setdefault(state.guild_id, []).append(time.perf_counter())
+        return ''
+
+    monkeypatch.setitem(tracker.CMD_TO_FN, 'track-help', probe)
+    guilds = [SimpleNamespace(id=i) for i in range(1, 4)]
+
+    async def run():
+        start = time.perf_counter()
+        await asyncio.gather(*(
+            tracker.on_message(message(guild, '!track-help'))
+            for _ in range(5)
+            for guild in guilds
+        ))
+        return start
+
+    start = asyncio.run(run())
+    assert all(serial)
+    assert max(overlap) > 1
+    assert {guild: len(times) for guild, times in finished.items()} == {
+        '1': 5, '2': 5, '3': 5
+    }
+    # The other guilds finish their five commands long before the slow one
+    # finishes its first.
+    assert max(finished['1'] + finished['3']) < min(finished['2'])
+    assert max(finished['2']) - start >= 5 * 0.3
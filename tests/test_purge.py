@@ -0,0 +1,59 @@
+import asyncio
+import copy
+from datetime import datetime
+
+import pytest
+
+import tracker
+
+
+class Message:
+    def __init__(self, channel, id):
+        self.channel = channel
+        self.created_at = datetime.utcnow()
+        self.id = id
+
+
+class Channel:
+    def __init__(self, count):
+        self.fail = False
+        self.id = 5
+        self.msgs = [Message(self, id) for id in range(1, count + 1)]
+
+    async def delete_messages(self, msgs):
+        await asyncio.sleep(0)
+        if self.fail:
+            raise RuntimeError('delete failed')
+        for msg in msgs:
+            self.msgs.remove(msg)
+
+    async def history(self, limit=None, after=None):
+        for msg in list(self.msgs):
+            if after is None or msg.id > after.id:
+                yield msg
+
+
+@pytest.fixture
+def state(monkeypatch):
+    monkeypatch.setattr(tracker.store, 'record', lambda *args: None)
+    monkeypatch.setattr(tracker.State, 'schedule_refresh', lambda self: None)
+    return tracker.State('1', copy.deepcopy(tracker.DEFAULT))
+
+
+def test_purge_deletes_full_batches(state):
+    state.channel = channel = Channel(250)
+    asyncio.run(state.purge_channel())
+    assert not channel.msgs
+    assert state.purged_through == 250
+
+
+def test_failed_purge_is_retried(state):
+    state.channel = channel = Channel(3)
+    channel.fail = True
+    with pytest.raises(RuntimeError):
+        asyncio.run(state.purge_channel())
+    assert state.purged_through is None
+    channel.fail = False
+    asyncio.run(state.purge_channel())
+    assert not channel.msgs
+    assert state.purged_through == 3
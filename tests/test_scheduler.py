@@ -0,0 +1,32 @@
+import asyncio
+import copy
+import time
+from types import SimpleNamespace
+
+import tracker
+from scheduler import RefreshScheduler
+
+
+def test_guild_without_channel_is_not_woken(monkeypatch):
+    monkeypatch.setattr(tracker.store, 'record', lambda *args: None)
+    calls = []
+
+    async def callback(guild):
+        calls.append(guild)
+        await state.scheduled_refresh()
+
+    monkeypatch.setattr(tracker, 'scheduler', RefreshScheduler(callback))
+    state = tracker.State('1', copy.deepcopy(tracker.DEFAULT))
+    # Overdue, as after a restart.
+    state.refresh_time -= 10
+
+    async def run():
+        tracker.scheduler.start()
+        state.schedule_refresh()
+        await asyncio.sleep(0.2)
+        assert not calls
+        state.channel = SimpleNamespace(id=5)
+        assert tracker.scheduler.due['1'] <= time.time()
+        tracker.scheduler.task.cancel()
+
+    asyncio.run(run())
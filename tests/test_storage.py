@@ -0,0 +1,37 @@
+import json
+
+from storage import GuildStore, SqliteStore
+
+
+def test_sqlite_imports_guild_dir_over_legacy_file(tmp_path):
+    legacy_path = tmp_path / 'config.json'
+    legacy_path.write_text(json.dumps({'1': {'channel': 5}}))
+    guild_dir = str(tmp_path / 'guilds')
+    files = GuildStore(guild_dir, 0)
+    files.load(str(legacy_path))
+    config = {
+        'alerts': ['prob > 0.5'],
+        'bosses': {},
+        'channel': 6,
+        'editors': [42],
+        'tracking': {'Maya': {'Anthell': [10, 0]}},
+        'version': 1
+    }
+    files.record('1', 'set', [], config)
+    files.record('2', 'set', [], {**config, 'channel': 7})
+    expected = {'1': config, '2': {**config, 'channel': 7}}
+
+    db_path = str(tmp_path / 'tracker.db')
+    store = SqliteStore(db_path, 0, guild_dir)
+    assert store.load(str(legacy_path)) == expected
+    store.close({})
+    assert SqliteStore(db_path, 0).load(str(legacy_path)) == expected
+
+
+def test_sqlite_falls_back_to_legacy_file(tmp_path):
+    legacy_path = tmp_path / 'config.json'
+    legacy_path.write_text(json.dumps({'1': {'channel': 5}}))
+    store = SqliteStore(
+        str(tmp_path / 'tracker.db'), 0, str(tmp_path / 'guilds')
+    )
+    assert store.load(str(legacy_path)) == {'1': {'channel': 5}}
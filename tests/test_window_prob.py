@@ -0,0 +1,46 @@
+import itertools
+from types import SimpleNamespace
+
+import pytest
+
+from tracker import State
+
+TIMES = [0, 1, 5, 10, 20, 30, 45, 60, 80, 90, 110, 120, 180, 240]
+STEPS = 600
+
+
+def spawn_prob(
+    now: float, min_spawn: float, max_spawn: float, window: float
+) -> float:
+    spawn = SimpleNamespace(min=min_spawn, max=max_spawn)
+    state = SimpleNamespace(
+        bosses={'boss': SimpleNamespace(spawns={'loc': spawn})},
+        calc_window_prob=State.calc_window_prob,
+        tracked={('boss', 'loc'): SimpleNamespace(tod=0, window=window)},
+    )
+    return State.calc_spawn_info(state, 'boss', 'loc', now)[2]
+
+
+def cases():
+    for min_spawn, max_spawn in itertools.combinations_with_replacement(
+        TIMES, 2
+    ):
+        if not max_spawn:
+            continue
+        windows = set(TIMES) | {
+            min_spawn, max_spawn / 2, (min_spawn + max_spawn) / 2, max_spawn
+        }
+        for window in sorted(windows):
+            if window <= max_spawn:
+                yield min_spawn, max_spawn, window
+
+
+@pytest.mark.parametrize('min_spawn,max_spawn,window', list(cases()))
+def test_window_prob_is_monotone(min_spawn, max_spawn, window):
+    prev = 0.0
+    for step in range(STEPS + 1):
+        now = 1.2 * max_spawn * step / STEPS
+        prob = spawn_prob(now, min_spawn, max_spawn, window)
+        assert -1e-9 <= prob <= 1 + 1e-9, now
+        assert prob >= prev - 1e-9, now
+        prev = prob
@@ -2,24 +2,33 @@ from __future__ import annotations
 
 import asyncio
 import copy
+import heapq
 import itertools
-import json
 import math
 import os
 import re
 import sys
 import time
 import traceback
-from asyncio import Lock, Task
-from collections.abc import Callable, Iterable
+from asyncio import Lock
+from collections.abc import Callable, Iterable, Iterator, MutableMapping
 from datetime import datetime, timedelta, timezone
-from types import CodeType
 from typing import Any, TypeVar
 
-from discord import Client, Embed, Guild, Message, Role, TextChannel
-from sortedcontainers import SortedDict, SortedSet
+from discord import (
+    Client, Embed, Guild, Member, Message, Object, Role, TextChannel
+)
+from sortedcontainers import SortedList
 
-from default import DEFAULT
+from alerts import (
+    HORIZON, AlertCheck, compile_alert, direction, first_true, never
+)
+from default import CATALOG, DEFAULT
+from model import Boss, BossConfig, Spawn, SpawnConfig, Tracked
+from names import LayeredIndex, NameIndex
+from scheduler import TICK, RefreshScheduler
+from storage import GuildStore, SqliteStore, Store
+from ttlcache import TTLCache
 
 T = TypeVar('T')
 
@@ -35,6 +44,9 @@ General Notes:
 
     !t can be used instead of !track. Also works for e.g. !t-add instead of
     !track-add.
+
+    If !track or !track-remove is given a name that matches no monster, it
+    offers the monsters with the closest names to choose from instead.
         
 Commands:
 
@@ -93,7 +105,11 @@ Example: !track-add-editor @User1 @User2
     expression recognizes the variables min, max, now, and prob, where min and
     max are the minimum and maximum absolute spawn times, now is the current
     time, and prob is the probability (0 <= prob <= 1) that the monster has
-    spawned. Must be a valid Python expression.
+    spawned. Must be a Python expression using only numbers, these variables,
+    arithmetic (+, -, *, /, //, %), comparisons and and/or/not. Alerts that,
+    once True, stay True (such as the examples below) go off the moment they
+    become True; others are checked whenever tracking information is
+    refreshed.
 Example (Alert 2 minutes after monster could've spawned): !t-alert now - min > 2
 Example (Alert when monster has at least 75% chance of being spawned):
     !t-alert prob > 0.75
@@ -109,6 +125,10 @@ Example (Alert when monster has at least 75% chance of being spawned):
 !track-auto-refresh <minutes> (editor only): Set the auto-refresh time to the
     specified number of minutes.
 
+!track-auto-refresh <minutes> adaptive (editor only): Like the above, but
+    auto-refresh pauses while nothing is being tracked. Tracked spawns count
+    minutes, so otherwise this refreshes just as often.
+
 !track-cancel <monsters...>: Cancel tracking for one or more monsters.
 Example: !track-cancel gtb missy
 
@@ -156,6 +176,11 @@ Examples:
     or  more users. This is the opposite of !track-add-editor.
 Example: !track-remove-editor @Keele @Hixxy
 
+!track-stats: Display how many servers are waiting for their next refresh, how
+    many were refreshed together last time and how late that batch ran, along
+    with how often this server's pending choice prompts and cached permission
+    checks were used, missed, expired or evicted. Arguments are ignored.
+
 !track-utc-offset: Display the current UTC offset of the server in HH:MM format
     with an optional leading minus sign.
 
@@ -169,8 +194,15 @@ BASE_EMBED_LEN = len('Enemy') + len('Up Time') + len('Up Now?')
 BULK_DELETE_GRACE_SECONDS = 300
 BULK_DELETE_DELTA = timedelta(days=14, seconds=-BULK_DELETE_GRACE_SECONDS)
 CHANNEL_MENTION_RE = re.compile(r'<#(\d+)>')
+COMPACT_INTERVAL = 600
 CONF = 'config.json'
-LOCK = Lock()
+CONF_DB = 'tracker.db'
+CONF_DIR = 'guilds'
+# Unanswered disambiguation prompts are forgotten after this many seconds, and
+# only the latest this many are kept per guild.
+DISAMB_MAX_SIZE = int(os.environ.get('DISAMB_MAX_SIZE', 100))
+DISAMB_TTL = float(os.environ.get('DISAMB_TTL', 600))
+FLUSH_INTERVAL = float(os.environ.get('FLUSH_INTERVAL', 5))
 MAX_EMBED_SIZE = 6000
 MAX_FIELD_SIZE = 1024
 MAX_NAME_CHARS = 40
@@ -182,34 +214,129 @@ MAX_BOSSES_PER_MSG = min(
     MAX_FIELD_SIZE // max(MAX_NAME_LEN, MAX_UP_TIME_LEN)
 )
 ME = 194263402959339520
+# At most this many mentioned members' permissions are cached per guild.
+PERMISSION_CACHE_SIZE = 100
+# Without the members intent, role changes are never reported, so cached
+# permissions are also rechecked after this many seconds.
+PERMISSION_TTL = 60
 ROLE_MENTION_RE = re.compile(r'<@&(\d+)>')
 USER_MENTION_RE = re.compile(r'<@(\d+)>')
 
 EMPTY_EMBED = Embed()
 EMPTY_EMBED.add_field(name='\u200b', value='\u200b')
 
+BASE_BOSSES = {boss: Boss.from_config(c) for boss, c in CATALOG.items()}
+# Shared by every guild, which only indexes its own bosses on top.
+BASE_INDEX = NameIndex.from_names(
+    (name, boss)
+    for boss, config in BASE_BOSSES.items()
+    for name in [*config.aliases, boss.lower().replace(' ', '_')]
+)
+
 client = Client()
+compact_task = None
 global_config = {}
 guild_to_state = {}
+scheduler = RefreshScheduler(
+    lambda guild: guild_to_state[guild].scheduled_refresh()
+)
+store: Store = (
+    SqliteStore(CONF_DB, FLUSH_INTERVAL, CONF_DIR)
+    if os.environ.get('STORAGE') == 'sqlite'
+    else GuildStore(CONF_DIR, FLUSH_INTERVAL)
+)
+
+Tracking = dict[str, dict[str, list[float]]]
+Config = dict[
+    str, int | list[int] | list[str] | dict[str, BossConfig | None] | Tracking
+]
+
+
+class Catalog(MutableMapping[str, Boss]):
+    base: dict[str, Boss]
+    overlay: dict[str, Boss | None]
 
-SpawnConfig = dict[str, bool | int | float]
-BossConfig = dict[str, list[str] | dict[str, SpawnConfig]]
-Config = dict[str, int | list[int] | list[str] | dict[str, BossConfig]]
+    def __init__(
+        self, base: dict[str, Boss], overlay: dict[str, Boss | None]
+    ) -> None:
+        self.base = base
+        self.overlay = overlay
+
+    def __delitem__(self, boss: str) -> None:
+        if boss not in self:
+            raise KeyError(boss)
+        if boss in self.base:
+            self.overlay[boss] = None
+        else:
+            del self.overlay[boss]
+
+    def __getitem__(self, boss: str) -> Boss:
+        if boss in self.overlay:
+            if (config := self.overlay[boss]) is None:
+                raise KeyError(boss)
+            return config
+        return self.base[boss]
+
+    def __iter__(self) -> Iterator[str]:
+        for boss in self.base:
+            if boss not in self.overlay:
+                yield boss
+        for boss, config in self.overlay.items():
+            if config is not None:
+                yield boss
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def __setitem__(self, boss: str, config: Boss) -> None:
+        self.overlay[boss] = config
+
+    def own(self, boss: str) -> Boss:
+        if boss not in self.overlay:
+            # The base catalog is shared by every guild, so copy before
+            # writing.
+            self.overlay[boss] = self.base[boss].copy()
+        return self.overlay[boss]
 
 
 class State:
+    guild_id: str
     config: Config
-    name_to_boss: SortedDict[str, set[str]]
-    boss_set: SortedSet[str]
-    tracked: dict[tuple[str, str], set[int]]
+    catalog: Catalog
+    name_index: LayeredIndex
+    tracked: dict[tuple[str, str], Tracked]
+    editors: set[int]
+    # Whether each mentioned member recently checked may manage the guild.
+    managers: TTLCache[int, bool]
     last_msg: Message | None
     send_time: float
     guild: Guild | None
-    disamb: dict[int, tuple[list, Callable, tuple]]
-    auto_refresh_task: Task | None
+    disamb: TTLCache[int, tuple[list, Callable, tuple]]
     refresh_time: float
-    alert_checks: list[CodeType]
+    spawn_cache: dict[tuple[str, str, float], tuple[float, float, float]]
+    row_cache: dict[tuple[str, str], tuple[str, str, str]]
+    row_heap: list[tuple[float, str, str]]
+    row_times: dict[tuple[str, str], float]
+    # Tracked spawns whose sort key is fixed for now, in board order. Spawns
+    # inside their spawn window are kept in moving and sorted on each render.
+    order: SortedList[tuple[tuple[float, float], str, str]]
+    order_entries: dict[tuple[str, str], tuple[tuple[float, float], str, str]]
+    order_heap: list[tuple[float, str, str]]
+    order_times: dict[tuple[str, str], float]
+    moving: set[tuple[str, str]]
+    expiry_heap: list[tuple[float, str, str]]
+    expiry_times: dict[tuple[str, str], float]
+    lock: Lock
+    # Both in the order of config['alerts'].
+    alert_checks: dict[int, AlertCheck]
+    alert_exprs: dict[int, str]
+    live_alerts: int
+    rising_alerts: int
+    alert_heap: list[tuple[float, str, str, int]]
+    alert_times: dict[tuple[str, str], dict[int, float]]
     messages: list[Message]
+    embed_keys: dict[int, int]
+    purged_through: int | None
     _alert_role: Role | None
     _channel: TextChannel | None
 
@@ -276,7 +403,7 @@ class State:
                 else:
                     result += inverse_window - (
                         inverse_time * inverse_time
-                    ) / 2 * window
+                    ) / (2 * window)
         else:
             after_gap = time_after - gap
             if after_gap <= 0:
@@ -289,11 +416,15 @@ class State:
                         2 * (time_after + window) - max_spawn - min_spawn
                     ) / (2 * window)
             elif time_after < inverse_window:
-                result = (window + 2 * (time_after - min_spawn))
+                result = window / 2 + time_after - min_spawn
             else:
                 result = length - (inverse_time * inverse_time) / (2 * window)
         return result / length
 
+    @staticmethod
+    def embed_key(embed: Embed) -> int:
+        return hash(tuple((f.name, f.value) for f in embed.fields))
+
     @staticmethod
     def extract_disamb_range(
         args: list[str]
@@ -340,42 +471,82 @@ class State:
                 return None
         return sorted(result)
 
-    def __init__(self, config: dict) -> None:
+    def __init__(self, guild_id: str, config: dict) -> None:
+        self.guild_id = guild_id
         self.config = config
-        self.name_to_boss = SortedDict()
-        self.boss_set = SortedSet()
-        self.tracked = {
-            (b, loc): set() for b in self.bosses for loc in self.spawns(b)
-            if self.is_tracked(b, loc)
-        }
+        # The live config holds model objects from here on, which are only
+        # turned back into JSON when persisted.
+        bosses = config['bosses']
+        for boss, boss_config in bosses.items():
+            bosses[boss] = boss_config and Boss.from_config(boss_config)
+        self.catalog = Catalog(BASE_BOSSES, bosses)
+        self.name_index = LayeredIndex(
+            BASE_INDEX, {boss for boss in bosses if boss in BASE_BOSSES}
+        )
+        self.tracked = {}
+        for boss, locs in config['tracking'].items():
+            for loc, (tod, window) in locs.items():
+                locs[loc] = self.tracked[boss, loc] = Tracked(tod, window)
 
+        self.editors = set(config['editors'])
+        self.managers = TTLCache(PERMISSION_TTL, PERMISSION_CACHE_SIZE)
         self.last_msg = None
         self.send_time = 0
         self.guild = None
-        self.disamb = {}
-        self.auto_refresh_task = None
+        self.disamb = TTLCache(DISAMB_TTL, DISAMB_MAX_SIZE)
         self.refresh_time = time.time() / 60
+        self.spawn_cache = {}
+        self.row_cache = {}
+        self.row_heap = []
+        self.row_times = {}
+        self.order = SortedList()
+        self.order_entries = {}
+        self.order_heap = []
+        self.order_times = {}
+        self.moving = set()
+        self.expiry_heap = []
+        self.expiry_times = {}
+        self.lock = Lock()
         self.messages = []
+        self.embed_keys = {}
+        self.purged_through = None
         self._alert_role = None
         self._channel = None
-        self.alert_checks = []
+        self.alert_checks = {}
+        self.alert_exprs = {}
+        self.live_alerts = 0
+        self.rising_alerts = 0
+        self.alert_heap = []
+        self.alert_times = {}
         for alert in config['alerts']:
-            self.alert_checks.append(compile(alert, '<string>', 'eval'))
+            try:
+                check = compile_alert(alert)
+            except (SyntaxError, ValueError) as e:
+                # Saved before alerts were restricted; kept so it can still be
+                # listed and removed, but never goes off.
+                print(f'Disabling alert "{alert}": {e}', file=sys.stderr)
+                check = never
+            self.register_alert(alert, check)
+        for boss, loc in self.tracked:
+            self.place(boss, loc)
+            self.schedule_expiry(boss, loc)
 
     @staticmethod
     def eval_condition(
-        code: CodeType,
+        check: AlertCheck,
         *,
         now: float,
         min_time: float,
         max_time: float,
         prob: float
     ) -> bool:
-        return eval(
-            code,
-            {'__builtins__': None},
-            {'now': now, 'min': min_time, 'max': max_time, 'prob': prob}
-        )
+        return check(now, min_time, max_time, prob)
+
+    @staticmethod
+    def is_rising(code_string: str) -> bool:
+        # Alerts which can only go from False to True over time are fired at
+        # the exact time they become True rather than polled.
+        return direction(code_string) in (0, 1)
 
     @property
     def alert_role(self) -> Role | None:
@@ -390,6 +561,7 @@ class State:
     @alert_role.setter
     def alert_role(self, value: Role) -> None:
         self.config['alert-role'] = value.id
+        self.record('set', ['alert-role'], value.id)
         self._alert_role = value
 
     @property
@@ -405,6 +577,15 @@ class State:
             components.append(a)
         return '\n'.join(components)
 
+    @property
+    def adaptive_refresh(self) -> bool:
+        return bool(self.config.get('adaptive-refresh'))
+
+    @adaptive_refresh.setter
+    def adaptive_refresh(self, value: bool) -> None:
+        self.config['adaptive-refresh'] = value
+        self.record('set', ['adaptive-refresh'], value)
+
     @property
     def auto_refresh(self) -> int:
         return self.config['auto-refresh']
@@ -412,17 +593,19 @@ class State:
     @auto_refresh.setter
     def auto_refresh(self, value: int) -> None:
         self.config['auto-refresh'] = value
+        self.record('set', ['auto-refresh'], value)
 
     @property
     def auto_refresh_str(self) -> str:
         auto_refresh = self.auto_refresh
         if not auto_refresh:
             return 'unset'
-        return quantity('minute', auto_refresh)
+        adaptive = ' (adaptive)' if self.adaptive_refresh else ''
+        return f'{quantity("minute", auto_refresh)}{adaptive}'
 
     @property
-    def bosses(self) -> dict[str, BossConfig]:
-        return self.config['bosses']
+    def bosses(self) -> Catalog:
+        return self.catalog
 
     @property
     def channel(self) -> TextChannel | None:
@@ -438,7 +621,12 @@ class State:
     def channel(self, value: TextChannel) -> None:
         self._channel = value
         self.config['channel'] = value.id
+        self.record('set', ['channel'], value.id)
         self.messages = []
+        self.embed_keys = {}
+        self.purged_through = None
+        # Nothing is scheduled until there is a channel to refresh.
+        self.schedule_refresh()
 
     @property
     def channel_str(self) -> str:
@@ -453,6 +641,12 @@ class State:
     @expire_time.setter
     def expire_time(self, value: int) -> None:
         self.config['expire'] = value
+        self.record('set', ['expire'], value)
+        # Where spawns sort and when they expire depend on the expire time.
+        for boss, loc in self.tracked:
+            self.place(boss, loc)
+            self.schedule_expiry(boss, loc)
+        self.schedule_refresh()
 
     @property
     def expire_time_str(self) -> str:
@@ -467,47 +661,63 @@ class State:
     @utc_offset.setter
     def utc_offset(self, value: int) -> None:
         self.config['utc-offset'] = value
+        self.record('set', ['utc-offset'], value)
 
     @property
     def utc_offset_str(self) -> str:
         return minutes_to_hhmm(self.utc_offset)
 
     def aliases(self, boss: str) -> list[str]:
-        return self.boss_conf(boss)['aliases']
+        return self.bosses[boss].aliases
 
-    def spawns(self, boss: str) -> dict[str, SpawnConfig]:
-        return self.boss_conf(boss)['spawns']
+    def spawns(self, boss: str) -> dict[str, Spawn]:
+        return self.bosses[boss].spawns
 
     def max(self, boss: str, loc: str) -> int:
-        return self.spawn(boss, loc)['max']
+        return self.bosses[boss].spawns[loc].max
 
     def min(self, boss: str, loc: str) -> int:
-        return self.spawn(boss, loc)['min']
+        return self.bosses[boss].spawns[loc].min
 
     def tod(self, boss: str, loc: str) -> float | None:
-        return self.spawn(boss, loc).get('tod')
+        if (tracked := self.tracked.get((boss, loc))) is None:
+            return None
+        return tracked.tod
 
     def window(self, boss: str, loc: str) -> float:
-        return self.spawn(boss, loc)['window']
+        return self.tracked[boss, loc].window
 
     def set_aliases(self, boss: str, aliases: set[str]) -> None:
-        self.boss_conf(boss)['aliases'] = sorted(
+        self.bosses.own(boss).aliases = sorted(
             aliases, key=lambda x: (len(x), x)
         )
-        for name in self.names(boss):
-            self.name_to_boss.setdefault(name, set()).add(boss)
+        self.record_boss(boss)
+        self.index(boss)
 
     def set_max(self, boss: str, loc: str, value: int) -> None:
-        self.spawn(boss, loc)['max'] = value
+        self.bosses.own(boss).spawns[loc].max = value
+        self.record_boss(boss)
+        self.forget_spawn(boss, loc)
+        if (boss, loc) in self.tracked:
+            self.place(boss, loc)
+            self.schedule_expiry(boss, loc)
+            self.schedule_alerts(boss, loc)
 
     def set_min(self, boss: str, loc: str, value: int) -> None:
-        self.spawn(boss, loc)['min'] = value
+        self.bosses.own(boss).spawns[loc].min = value
+        self.record_boss(boss)
+        self.forget_spawn(boss, loc)
+        if (boss, loc) in self.tracked:
+            self.place(boss, loc)
+            self.schedule_alerts(boss, loc)
 
     def set_tod(
         self, boss: str, loc: str, value: float, window: float
     ) -> None:
-        self.spawn(boss, loc)['tod'] = value
-        self.spawn(boss, loc)['window'] = window
+        tracked = Tracked(value, window)
+        self.config['tracking'].setdefault(boss, {})[loc] = tracked
+        self.tracked[boss, loc] = tracked
+        self.record('set', ['tracking', boss, loc], tracked.to_config())
 
     def add(
         self, boss: str, config: BossConfig, add_implicit_aliases: bool
@@ -517,46 +727,90 @@ class State:
             if ' ' in boss:
                 all_aliases.add(boss.lower().replace(' ', ''))
                 all_aliases.add(''.join(s[0].lower() for s in boss.split()))
-        self.boss_set.add(boss)
-        self.bosses[boss] = config
+        self.bosses[boss] = Boss.from_config(config)
         self.set_aliases(boss, all_aliases)
 
-    def add_alert(self, now: float, code_string: str, code: CodeType) -> None:
-        self.alert_checks.append(code)
+    def add_alert(
+        self, now: float, code_string: str, check: AlertCheck
+    ) -> None:
+        i = self.register_alert(code_string, check)
+        bit = 1 << i
         # noinspection PyTypeChecker
         self.config['alerts'].append(code_string)
-        for (boss, loc), future_alerts in self.tracked.items():
-            i = len(self.alert_checks) - 1
+        self.record('append', ['alerts'], code_string)
+        for (boss, loc), tracked in self.tracked.items():
+            # IDs are reused, so clear anything left over from a removed alert.
+            tracked.pending &= ~bit
+            self.alert_times.get((boss, loc), {}).pop(i, None)
             min_time, max_time, prob = self.spawn_info(boss, loc)
             if not self.eval_condition(
-                self.alert_checks[i],
+                check,
                 now=now,
                 min_time=min_time,
                 max_time=max_time,
                 prob=prob
             ):
                 # Only add alert for monsters for which it is not already true.
-                future_alerts.add(i)
+                tracked.pending |= bit
+                if self.rising_alerts & bit:
+                    self.schedule_alert(boss, loc, i, self.refresh_time)
+        self.schedule_refresh()
+
+    def add_editor(self, member: int) -> None:
+        self.editors.add(member)
+        self.config['editors'].append(member)
+        self.record('append', ['editors'], member)
 
     async def add_message(self, message: Message) -> None:
         self.messages.append(message)
 
+    def add_spawn(self, boss: str, loc: str, config: SpawnConfig) -> None:
+        # Other spawns' labels may now need their map.
+        self.forget_rows(boss)
+        self.bosses.own(boss).spawns[loc] = Spawn.from_config(config)
+        self.record_boss(boss)
+
+    def alert_holds(self, boss: str, loc: str, i: int, now: float) -> bool:
+        min_time, max_time, prob = self.calc_spawn_info(boss, loc, now)
+        return self.eval_condition(
+            self.alert_checks[i],
+            now=now,
+            min_time=min_time,
+            max_time=max_time,
+            prob=prob
+        )
+
+    def alert_stale(self, when: float, boss: str, loc: str, i: int) -> bool:
+        # Entries superseded by a later schedule_alert or belonging to a
+        # removed alert are discarded lazily.
+        return (
+            not self.live_alerts >> i & 1 or
+            self.alert_times.get((boss, loc), {}).get(i) != when
+        )
+
     def alerts_msg(self) -> str:
         components = []
-        alerts = self.alerts
-        for (boss, loc), future_alerts in self.tracked.items():
-            for i in self.new_alerts(self.refresh_time, boss, loc):
-                future_alerts.remove(i)
-                components.append(f'{self.boss_label(boss, loc)}: {alerts[i]}')
+        due = self.due_alerts()
+        polled = self.live_alerts & ~self.rising_alerts
+        for (boss, loc), tracked in self.tracked.items():
+            fired = due.get((boss, loc), 0)
+            if tracked.pending & polled:
+                fired |= self.new_alerts(
+                    self.refresh_time, boss, loc, tracked.pending & polled
+                )
+            if not fired:
+                continue
+            tracked.pending &= ~fired
+            for i in bits(fired):
+                components.append(
+                    f'{self.boss_label(boss, loc)}: {self.alert_exprs[i]}'
+                )
         if not components:
             return ''
         if role := self.alert_role:
             components.append(role.mention)
         return '\n'.join(components)
 
-    def boss_conf(self, boss: str) -> BossConfig:
-        return self.bosses[boss]
-
     def boss_info(self, boss: str) -> str:
         aliases = self.aliases(boss)
         alias_str = (
@@ -583,35 +837,52 @@ class State:
             return 1, min_time
         return -prob, min_time
 
+    def calc_spawn_info(
+        self, boss: str, loc: str, now: float
+    ) -> tuple[float, float, float]:
+        tracked = self.tracked[boss, loc]
+        tod = tracked.tod
+        window = tracked.window
+        spawn = self.bosses[boss].spawns[loc]
+        min_spawn = spawn.min
+        max_spawn = spawn.max
+        min_time = tod + max(0.0, min_spawn - window)
+        max_time = tod + max_spawn
+        if now >= max_time:
+            return min_time, max_time, 1
+        if now <= min_time:
+            return min_time, max_time, 0
+        if window and min_spawn != max_spawn:
+            prob = self.calc_window_prob(
+               now - tod, min_spawn, max_spawn, window
+            )
+        else:
+            prob = (now - min_time) / (max_time - min_time)
+        return min_time, max_time, prob
+
     def cancel(self, boss: str, loc: str) -> bool:
+        self.forget_spawn(boss, loc)
+        self.alert_times.pop((boss, loc), None)
+        self.unplace(boss, loc)
+        self.expiry_times.pop((boss, loc), None)
         if self.tracked.pop((boss, loc), None) is not None:
-            del self.spawn(boss, loc)['tod']
-            del self.spawn(boss, loc)['window']
-            return True
-        return False
-
-    def check_expire(self, boss: str, loc: str) -> bool:
-        if not self.expire_time:
-            return False
-        _, max_spawn = self.spawn_time(boss, loc)
-        if (
-            self.refresh_time - self.tod(boss, loc)
-            > max(2 * max_spawn, self.expire_time)
-        ):
-            self.cancel(boss, loc)
+            tracking = self.config['tracking']
+            del tracking[boss][loc]
+            self.record('del', ['tracking', boss, loc])
+            if not tracking[boss]:
+                del tracking[boss]
+                self.record('del', ['tracking', boss])
             return True
         return False
 
     async def disambiguate(self, i: int) -> str | None:
         i -= 1
-        if disamb_info := self.disamb.get(self.last_msg.author.id, None):
+        if disamb_info := self.disamb.get(self.last_msg.author.id):
             options, fn, args = disamb_info
             if i >= len(options):
                 return None
             del self.disamb[self.last_msg.author.id]
-            result = await fn(self, options[i], *args)
-            save()
-            return result
+            return await fn(self, options[i], *args)
         return None
 
     def disambiguation_prompt(
@@ -628,11 +899,27 @@ class State:
             )
         str_options, options = zip(*options)
         self.disamb[self.last_msg.author.id] = options, fn, args
-        self.refresh_time = time.time() / 60
+        self.tick()
         return f'{msg}\n\n' + '\n'.join(
             f'{i}) {opt}' for i, opt in enumerate(str_options, 1)
         )
 
+    def due_alerts(self) -> dict[tuple[str, str], int]:
+        due = {}
+        heap = self.alert_heap
+        # The scheduler may wake a guild up to TICK seconds early.
+        while heap and heap[0][0] <= self.refresh_time + TICK / 60:
+            when, boss, loc, i = heapq.heappop(heap)
+            if self.alert_stale(when, boss, loc, i):
+                continue
+            del self.alert_times[boss, loc][i]
+            if self.alert_holds(boss, loc, i, when):
+                due[boss, loc] = due.get((boss, loc), 0) | 1 << i
+            else:
+                # Nothing was found within HORIZON, so look further ahead.
+                self.schedule_alert(boss, loc, i, when)
+        return due
+
     def embeds(self) -> list[Embed]:
         embeds = []
         total_chars = BASE_EMBED_LEN
@@ -643,14 +930,9 @@ class State:
         prob_lines = []
         embed = Embed()
         first_fields = True
-        for boss, loc in [
-            (x, loc) for x, loc in sorted(
-                self.tracked, key=lambda z: self.boss_sort_key(z[0], z[1])
-            )
-            if not self.check_expire(x, loc)
-        ]:
+        for boss, loc in self.sorted_tracked():
             should_reset = False
-            name, up_time, prob = self.tracking_line(boss, loc)
+            name, up_time, prob = self.row(boss, loc)
             name_len = len(name) + 1
             up_time_len = len(up_time) + 1
             prob_len = len(prob) + 1
@@ -697,36 +979,84 @@ class State:
             embeds.append(embed)
         return embeds
 
+    def expire_deadline(self, boss: str, loc: str) -> float:
+        return self.tod(boss, loc) + max(
+            2 * self.max(boss, loc), self.expire_time
+        )
+
     def first_spawn(self, bosses: set[str]) -> tuple[str, str]:
         boss = first(bosses)
         return boss, first(self.spawns(boss))
 
+    def expire_rows(self) -> None:
+        heap = self.row_heap
+        while heap and heap[0][0] <= self.refresh_time:
+            when, boss, loc = heapq.heappop(heap)
+            if self.row_times.get((boss, loc)) == when:
+                self.forget_row(boss, loc)
+
+    def forget_permissions(self, member: int | None = None) -> None:
+        if member is None:
+            self.managers.clear()
+        elif member in self.managers:
+            del self.managers[member]
+
+    def forget_row(self, boss: str, loc: str) -> None:
+        self.row_cache.pop((boss, loc), None)
+        self.row_times.pop((boss, loc), None)
+
+    def forget_rows(self, boss: str) -> None:
+        for loc in self.tracked_locs(boss):
+            self.forget_row(boss, loc)
+
+    def forget_spawn(self, boss: str, loc: str) -> None:
+        self.spawn_cache.pop((boss, loc, self.refresh_time), None)
+        self.forget_row(boss, loc)
+
     def format_time(self, t: float) -> str:
         time_obj = time.gmtime(60 * (t + self.utc_offset))
         return f'{time_obj.tm_hour:02d}:{time_obj.tm_min:02d}'
 
+    def index(self, boss: str) -> None:
+        for name in self.names(boss):
+            self.name_index.add(name, boss)
+
     def is_editor(self, member: int | None = None) -> bool:
         if member is None:
-            member = self.last_msg.author
-        else:
-            member = (
-                [m for m in self.last_msg.channel.members if m.id == member][0]
+            # The author comes with the message, so is always current.
+            author = self.last_msg.author
+            return (
+                author.id in self.editors or
+                author.guild_permissions.manage_guild
             )
-        return (
-            member.id in self.config['editors']
-            or member.guild_permissions.manage_guild
-        )
+        if member in self.editors:
+            return True
+        if (manages := self.managers.get(member)) is None:
+            found = self.guild.get_member(member)
+            manages = found is not None and found.guild_permissions.manage_guild
+            self.managers[member] = manages
+        return manages
 
     def is_tracked(self, boss: str, loc: str) -> bool:
         return self.tod(boss, loc) is not None
 
+    def move_alerts(
+        self, boss: str, loc: str, new_boss: str, new_loc: str
+    ) -> None:
+        if times := self.alert_times.pop((boss, loc), None):
+            self.alert_times[new_boss, new_loc] = times
+            for i, when in times.items():
+                heapq.heappush(self.alert_heap, (when, new_boss, new_loc, i))
+
     def names(self, boss: str) -> set[str]:
         return set(itertools.chain(self.aliases(boss), [self.boss_key(boss)]))
 
-    def new_alerts(self, now: float, boss: str, loc: str) -> set[int]:
+    def new_alerts(
+        self, now: float, boss: str, loc: str, pending: int
+    ) -> int:
         min_time, max_time, prob = self.spawn_info(boss, loc)
-        result = set()
-        for i in self.tracked[boss, loc]:
+        result = 0
+        for i in bits(pending):
             if self.eval_condition(
                 self.alert_checks[i],
                 now=now,
@@ -734,9 +1064,15 @@ class State:
                 max_time=max_time,
                 prob=prob
             ):
-                result.add(i)
+                result |= 1 << i
         return result
 
+    def next_alert(self) -> float | None:
+        heap = self.alert_heap
+        while heap and self.alert_stale(*heap[0]):
+            heapq.heappop(heap)
+        return heap[0][0] if heap else None
+
     def parse_time(self, text: str) -> float | None:
         minutes = parse_time(text)
         if minutes is None or minutes < 0:
@@ -757,7 +1093,12 @@ class State:
         bulk_deletable = []
         message_ids = set(m.id for m in self.messages)
         awaitables = []
-        async for msg in channel.history(limit=None):
+        # Everything up to purged_through was already handled, so only a full
+        # scan after startup or a channel change has to walk the history.
+        after = self.purged_through and Object(id=self.purged_through)
+        purged_through = self.purged_through
+        async for msg in channel.history(limit=None, after=after):
+            purged_through = max(purged_through or 0, msg.id)
             if msg.id in message_ids:
                 continue
             if msg.created_at > cutoff:
@@ -766,7 +1107,8 @@ class State:
                     awaitables.append(asyncio.create_task(
                         channel.delete_messages(bulk_deletable)
                     ))
-                    bulk_deletable.clear()
+                    # The task has not run yet, so it still needs this list.
+                    bulk_deletable = []
             else:
                 awaitables.append(asyncio.create_task(msg.delete()))
         if bulk_deletable:
@@ -775,112 +1117,236 @@ class State:
             )
         for awaitable in awaitables:
             await awaitable
+        # Only once every delete went through, so a failed one is retried by
+        # scanning the same history again.
+        self.purged_through = purged_through
 
     async def refresh(self) -> None:
         channel = self.channel
         if not channel:
             return
-        self.refresh_time = time.time() / 60
+        self.tick()
+        self.sweep_expired()
+        self.expire_rows()
         alerts_msg = self.alerts_msg()
         embeds = self.embeds()
         tasks = []
         for _ in range(len(self.messages) - len(embeds)):
-            self.messages.pop()
+            message = self.messages.pop()
+            self.embed_keys.pop(message.id, None)
+            # Already seen by purge_channel, so it has to be deleted here.
+            tasks.append((None, None, asyncio.create_task(message.delete())))
         for _ in range(len(embeds) - len(self.messages)):
             await self.add_message(await channel.send(embed=EMPTY_EMBED))
         for embed, message in zip(embeds, self.messages):
-            tasks.append(asyncio.create_task(message.edit(embed=embed)))
-        for task in tasks:
+            key = self.embed_key(embed)
+            if self.embed_keys.get(message.id) == key:
+                continue
+            tasks.append((
+                message, key, asyncio.create_task(message.edit(embed=embed))
+            ))
+        for message, key, task in tasks:
             await task
+            if message:
+                self.embed_keys[message.id] = key
         await self.purge_channel()
         if alerts_msg:
             for embed in embed_splits(alerts_msg, 'Alerts'):
                 await channel.send(embed=embed)
+        # Commands refresh once they change anything, which may bring the next
+        # refresh forward.
+        self.schedule_refresh()
 
     def remove(self, boss: str, loc: str) -> bool:
+        self.forget_rows(boss)
         cancelled = self.cancel(boss, loc)
-        spawns = self.spawns(boss)
+        spawns = self.bosses.own(boss).spawns
         del spawns[loc]
         if not spawns:
-            self.boss_set.remove(boss)
             self.remove_aliases(boss)
             del self.bosses[boss]
+        self.record_boss(boss)
         return cancelled
 
+    def record(self, op: str, path: list[str | int], arg: Any = None) -> None:
+        store.record(self.guild_id, op, path, arg)
+
+    def record_boss(self, boss: str) -> None:
+        overlay = self.bosses.overlay
+        if boss in overlay:
+            config = overlay[boss] and overlay[boss].to_config()
+            self.record('set', ['bosses', boss], config)
+        else:
+            self.record('del', ['bosses', boss])
+
+    def register_alert(self, code_string: str, check: AlertCheck) -> int:
+        # Takes the lowest unused ID, keeping the bitmasks narrow.
+        i = (~self.live_alerts & (self.live_alerts + 1)).bit_length() - 1
+        self.alert_checks[i] = check
+        self.alert_exprs[i] = code_string
+        self.live_alerts |= 1 << i
+        if self.is_rising(code_string):
+            self.rising_alerts |= 1 << i
+        return i
+
     def remove_alert(self, i: int) -> None:
         del self.alerts[i]
-        del self.alert_checks[i]
-        for future_alerts in self.tracked.values():
-            future_alerts.discard(i)
-            decrement = {j for j in future_alerts if j > i}
-            future_alerts -= decrement
-            future_alerts |= {j - 1 for j in decrement}
+        self.record('del', ['alerts', i])
+        alert_id = list(self.alert_exprs)[i]
+        del self.alert_checks[alert_id]
+        del self.alert_exprs[alert_id]
+        # Pending bits and scheduled times for the alert are left in place and
+        # ignored until its ID is reused.
+        self.live_alerts &= ~(1 << alert_id)
+        self.rising_alerts &= ~(1 << alert_id)
+
+    def remove_editor(self, member: int) -> None:
+        self.config['editors'].remove(member)
+        self.editors.discard(member)
+        self.record('remove', ['editors'], member)
 
     def remove_aliases(self, boss: str) -> None:
         for alias in self.names(boss):
-            bosses = self.name_to_boss[alias]
-            bosses.remove(boss)
-            if not bosses:
-                del self.name_to_boss[alias]
+            self.name_index.remove(alias, boss)
 
     def resolve(self, name: str) -> set[str]:
         name = name.replace(' ', '_').lower()
-        idx = self.name_to_boss.bisect_left(name)
-        items = self.name_to_boss.items()
-        bosses = set()
-
-        # noinspection PyUnresolvedReferences
-        while idx < len(self.name_to_boss) and items[idx][0].startswith(name):
-            # noinspection PyUnresolvedReferences
-            full, new_bosses = self.name_to_boss.items()[idx]
-            if full == name:
-                return set(new_bosses)
-            bosses |= new_bosses
-            idx += 1
-        return bosses
+        return set(self.name_index.lookup(name))
 
     def resolve_tracked(self, name: str) -> list[tuple[str, str]]:
         bosses = self.resolve(name)
         return sorted(
-            (b, loc) for b in bosses for loc in self.spawns(b)
-            if (b, loc) in self.tracked
+            (b, loc) for b in bosses for loc in self.tracked_locs(b)
         )
 
-    async def schedule_refresh(self) -> None:
-        sleep_time = max(
-            0.0,
-            60 * (self.auto_refresh + self.refresh_time) - time.time()
+    def row(self, boss: str, loc: str) -> tuple[str, str, str]:
+        if (line := self.row_cache.get((boss, loc))) is None:
+            line = self.tracking_line(boss, loc)
+            if (when := self.row_transition(boss, loc)) > self.refresh_time:
+                self.row_cache[boss, loc] = line
+                self.row_times[boss, loc] = when
+                heapq.heappush(self.row_heap, (when, boss, loc))
+        return line
+
+    def row_transition(self, boss: str, loc: str) -> float:
+        # The next time tracking_line may give something different.
+        now = self.refresh_time
+        min_time, max_time, _ = self.spawn_info(boss, loc)
+        if min_time <= now < max_time:
+            # The probability is going up.
+            return now
+        transitions = [
+            min_time + next_round_change(now - min_time),
+            max_time + next_round_change(now - max_time)
+        ]
+        if now < min_time:
+            transitions.append(min_time)
+        return min(transitions)
+
+    def schedule_alert(self, boss: str, loc: str, i: int, start: float) -> None:
+        end = max(start, self.tod(boss, loc) + self.max(boss, loc)) + HORIZON
+        when = first_true(
+            lambda now: self.alert_holds(boss, loc, i, now), start, end
         )
-        if sleep_time:
-            await asyncio.sleep(sleep_time)
-        async with LOCK:
-            since_last = time.time() / 60 - self.refresh_time
-            if since_last >= self.auto_refresh - 0.001:
-                await self.refresh()
-            self.auto_refresh_task = asyncio.create_task(
-                self.schedule_refresh()
-            )
+        # If the alert does not go off by the end, check again then.
+        when = end if when is None else when
+        self.alert_times.setdefault((boss, loc), {})[i] = when
+        heapq.heappush(self.alert_heap, (when, boss, loc, i))
+        if self.alert_heap[0][0] == when:
+            self.schedule_refresh()
+
+    def schedule_alerts(self, boss: str, loc: str) -> None:
+        self.alert_times.pop((boss, loc), None)
+        for i in bits(self.tracked[boss, loc].pending & self.rising_alerts):
+            self.schedule_alert(boss, loc, i, self.refresh_time)
+
+    def place(self, boss: str, loc: str) -> None:
+        self.unplace(boss, loc)
+        min_time, max_time, _ = self.spawn_info(boss, loc)
+        now = self.refresh_time
+        if min_time < now < max_time:
+            self.moving.add((boss, loc))
+            change = max_time
+        else:
+            entry = self.boss_sort_key(boss, loc), boss, loc
+            self.order.add(entry)
+            self.order_entries[boss, loc] = entry
+            if now <= min_time:
+                change = min_time
+            elif self.expire_time and now <= max_time + self.expire_time:
+                change = max_time + self.expire_time
+            else:
+                return
+        # The current placement stays right up to and including change.
+        self.order_times[boss, loc] = change
+        heapq.heappush(self.order_heap, (change, boss, loc))
+
+    def refresh_due(self) -> float | None:
+        if not self.auto_refresh:
+            return None
+        if self.adaptive_refresh and not self.tracked:
+            # Every tracked row's text changes within a minute, so only an
+            # empty board can go without refreshing.
+            return None
+        return self.refresh_time + self.auto_refresh
+
+    def schedule_expiry(self, boss: str, loc: str) -> None:
+        if not self.expire_time:
+            self.expiry_times.pop((boss, loc), None)
+            return
+        deadline = self.expire_deadline(boss, loc)
+        self.expiry_times[boss, loc] = deadline
+        heapq.heappush(self.expiry_heap, (deadline, boss, loc))
+
+    def schedule_refresh(self) -> None:
+        if not self.channel:
+            # refresh() would return early and leave the due time in the
+            # past, so the guild would be woken again straight away.
+            scheduler.unschedule(self.guild_id)
+            return
+        due = [
+            due
+            for due in (self.refresh_due(), self.next_alert())
+            if due is not None
+        ]
+        if due:
+            scheduler.schedule(self.guild_id, 60 * min(due))
+        else:
+            scheduler.unschedule(self.guild_id)
 
-    def spawn(self, boss: str, loc: str) -> SpawnConfig:
-        return self.spawns(boss)[loc]
+    async def scheduled_refresh(self) -> None:
+        async with self.lock:
+            try:
+                if any(
+                    due is not None and 60 * due <= time.time() + TICK
+                    for due in (self.refresh_due(), self.next_alert())
+                ):
+                    await self.refresh()
+            except Exception:
+                print(traceback.format_exc(), file=sys.stderr)
+            self.schedule_refresh()
+
+    def sorted_tracked(self) -> list[tuple[str, str]]:
+        heap = self.order_heap
+        while heap and heap[0][0] < self.refresh_time:
+            when, boss, loc = heapq.heappop(heap)
+            if self.order_times.get((boss, loc)) == when:
+                self.place(boss, loc)
+        moving = sorted(
+            (self.boss_sort_key(boss, loc), boss, loc)
+            for boss, loc in self.moving
+        )
+        return [
+            (boss, loc) for _, boss, loc in heapq.merge(self.order, moving)
+        ]
 
     def spawn_info(self, boss: str, loc: str) -> tuple[float, float, float]:
-        tod = self.tod(boss, loc)
-        min_spawn, max_spawn = self.spawn_time(boss, loc)
-        window = self.window(boss, loc)
-        min_time = tod + max(0.0, min_spawn - window)
-        max_time = tod + max_spawn
-        if self.refresh_time >= max_time:
-            return min_time, max_time, 1
-        if self.refresh_time <= min_time:
-            return min_time, max_time, 0
-        if window and min_spawn != max_spawn:
-            prob = self.calc_window_prob(
-               self.refresh_time - tod, min_spawn, max_spawn, window
+        key = boss, loc, self.refresh_time
+        if (info := self.spawn_cache.get(key)) is None:
+            info = self.spawn_cache[key] = self.calc_spawn_info(
+                boss, loc, self.refresh_time
             )
-        else:
-            prob = (self.refresh_time - min_time) / (max_time - min_time)
-        return min_time, max_time, prob
+        return info
 
     def spawn_options(
         self, bosses: set[str]
@@ -901,15 +1367,47 @@ class State:
     def spawn_time(self, boss: str, loc: str) -> tuple[int, int]:
         return self.min(boss, loc), self.max(boss, loc)
 
+    def suggestions(self, name: str) -> list[tuple[str, tuple[str, str]]]:
+        # Spawn options for bosses with names close to one that matched none,
+        # closest first.
+        name = name.replace(' ', '_').lower()
+        return [
+            option for boss in self.name_index.suggest(name)
+            for option in self.spawn_options({boss})
+        ]
+
+    def sweep_expired(self) -> None:
+        heap = self.expiry_heap
+        while heap and heap[0][0] < self.refresh_time:
+            deadline, boss, loc = heapq.heappop(heap)
+            if self.expiry_times.get((boss, loc)) == deadline:
+                self.cancel(boss, loc)
+
+    def tick(self) -> None:
+        # Cached spawn info is only valid for the refresh time it was
+        # computed at.
+        self.refresh_time = time.time() / 60
+        self.spawn_cache.clear()
+
     def track(
         self, boss: str, loc: str, tod: float, window: float | None
     ) -> None:
         self.cancel(boss, loc)
         self.set_tod(boss, loc, tod, window)
-        self.tracked[boss, loc] = set(range(len(self.alert_checks)))
+        self.forget_spawn(boss, loc)
+        self.place(boss, loc)
+        self.schedule_expiry(boss, loc)
 
         # Don't alert for conditions that are already true.
-        self.tracked[boss, loc] -= self.new_alerts(tod, boss, loc)
+        self.tracked[boss, loc].pending = self.live_alerts & ~self.new_alerts(
+            tod, boss, loc, self.live_alerts
+        )
+        self.schedule_alerts(boss, loc)
+
+    def tracked_locs(self, boss: str) -> dict[str, Tracked]:
+        # The tracking config doubles as an index of each boss's tracked
+        # spawns, since it is kept in step with tracked.
+        return self.config['tracking'].get(boss, {})
 
     def tracking_line(self, boss: str, loc: str) -> tuple[str, str, str]:
         name = self.boss_label(boss, loc)
@@ -942,18 +1440,35 @@ class State:
     def unambiguous(self, bosses: set[str]) -> bool:
         return len(bosses) == 1 and len(self.spawns(first(bosses))) == 1
 
+    def unplace(self, boss: str, loc: str) -> None:
+        if entry := self.order_entries.pop((boss, loc), None):
+            self.order.remove(entry)
+        self.moving.discard((boss, loc))
+        self.order_times.pop((boss, loc), None)
+
     def update_boss(
         self, boss: str, new_name: str, new_aliases: set[str]
     ) -> None:
         self.remove_aliases(boss)
+        self.forget_rows(boss)
 
         if new_name != boss:
-            for loc in self.spawns(boss):
-                if (alerts := self.tracked.pop((boss, loc), None)) is not None:
-                    self.tracked[new_name, loc] = alerts
-            self.boss_set.remove(boss)
-            self.boss_set.add(new_name)
-            self.bosses[new_name] = self.bosses.pop(boss)
+            moved = list(self.tracked_locs(boss))
+            for loc in moved:
+                self.tracked[new_name, loc] = self.tracked.pop((boss, loc))
+                self.move_alerts(boss, loc, new_name, loc)
+                self.unplace(boss, loc)
+            tracking = self.config['tracking']
+            if boss in tracking:
+                tracking[new_name] = tracking.pop(boss)
+                self.record('move', ['tracking', boss], new_name)
+            self.bosses[new_name] = self.bosses.own(boss)
+            del self.bosses[boss]
+            self.record_boss(boss)
+            for loc in moved:
+                self.expiry_times.pop((boss, loc), None)
+                self.place(new_name, loc)
+                self.schedule_expiry(new_name, loc)
 
         self.set_aliases(new_name, new_aliases)
 
@@ -971,26 +1486,76 @@ class State:
         self.set_max(boss, loc, new_max)
 
         if new_map != loc:
-            self.spawns(boss)[new_map] = self.spawns(boss).pop(loc)
-            if (alerts := self.tracked.pop((boss, loc), None)) is not None:
-                self.tracked[boss, new_map] = alerts
+            self.forget_spawn(boss, loc)
+            spawns = self.bosses.own(boss).spawns
+            spawns[new_map] = spawns.pop(loc)
+            self.record_boss(boss)
+            if (tracked := self.tracked.pop((boss, loc), None)) is not None:
+                self.tracked[boss, new_map] = tracked
+                self.move_alerts(boss, loc, boss, new_map)
+                tracking = self.config['tracking'][boss]
+                tracking[new_map] = tracking.pop(loc)
+                self.record('move', ['tracking', boss, loc], new_map)
+                self.unplace(boss, loc)
+                self.expiry_times.pop((boss, loc), None)
+                self.place(boss, new_map)
+                self.schedule_expiry(boss, new_map)
         self.update_boss(boss, new_name, new_aliases)
+        self.schedule_refresh()
 
 
 def _fail(fail_msg: str, reason: str) -> str:
     return f'{fail_msg}: {reason}'
 
 
+def bits(mask: int) -> Iterator[int]:
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+def cache_stats(cache: TTLCache) -> str:
+    misses = 'miss' if cache.misses == 1 else 'misses'
+    return (
+        f'{quantity("hit", cache.hits)}, {cache.misses} {misses}, '
+        f'{cache.expired} expired, {cache.evicted} evicted'
+    )
+
+
+def command_name(word: str) -> str:
+    cmd = word[1:]
+    if cmd == 't' or cmd.startswith('t-'):
+        cmd = f'track{cmd[1:]}'
+    return cmd
+
+
+async def compact_journal() -> None:
+    while True:
+        await asyncio.sleep(COMPACT_INTERVAL)
+        try:
+            await store.compact(global_config)
+        except Exception:
+            # The journal keeps everything, so try again next time.
+            print(traceback.format_exc(), file=sys.stderr)
+
+
 def first(it: Iterable[T]) -> T:
     return next(iter(it))
 
 
+def forget_permissions(guild: Guild, member: int | None = None) -> None:
+    if state := guild_to_state.get(str(guild.id)):
+        state.forget_permissions(member)
+
+
 async def init_state(guild: str) -> State:
     config = copy.deepcopy(DEFAULT)
     global_config[guild] = config
-    state = State(config)
-    load_state(guild, state, True)
-    state.auto_refresh_task = asyncio.create_task(state.schedule_refresh())
+    state = State(guild, config)
+    load_state(guild, state)
+    store.record(guild, 'set', [], config)
+    state.schedule_refresh()
     return state
 
 
@@ -1001,10 +1566,23 @@ def int_or_none(arg: str) -> int | None:
         return None
 
 
-def load_state(guild: str, state: State, add_aliases: bool) -> None:
+def is_relevant(message: Message) -> bool:
+    # Runs before any locking or state creation, so plain chat costs next to
+    # nothing.
+    if message.guild is None:
+        return False
+    content = message.content.lstrip()
+    if content.startswith('!'):
+        return command_name(content.split(maxsplit=1)[0]) in CMD_TO_FN
+    state = guild_to_state.get(str(message.guild.id))
+    return state is not None and message.author.id in state.disamb
+
+
+def load_state(guild: str, state: State) -> None:
     guild_to_state[guild] = state
-    for boss_name, boss_config in state.bosses.items():
-        state.add(boss_name, boss_config, add_aliases)
+    for boss, config in state.bosses.overlay.items():
+        if config is not None:
+            state.index(boss)
 
 
 def minutes_to_hhmm(minutes: int) -> str:
@@ -1013,6 +1591,11 @@ def minutes_to_hhmm(minutes: int) -> str:
     return f'{minus_maybe}{hours:02d}:{minutes:02d}'
 
 
+def next_round_change(x: float) -> float:
+    # The smallest value above x at which round may give something different.
+    return math.floor(x + 0.5) + 0.5
+
+
 def parse_channel_mention(txt: str) -> int | None:
     match = CHANNEL_MENTION_RE.match(txt)
     if not match:
@@ -1067,11 +1650,6 @@ def quantity(name: str, amount: int) -> str:
     return f'{amount} {name}{s_maybe}'
 
 
-def save() -> None:
-    with open(CONF, 'w') as f:
-        json.dump(global_config, f)
-
-
 def next_chunk(
     i: int, lines: list[str], max_len: int, chunk_lines: list[str]
 ) -> int:
@@ -1134,14 +1712,32 @@ def sign_hr_min_split(minutes: int) -> tuple[bool, int, int]:
     return sign, minutes // 60, minutes % 60
 
 
+def upgrade_config(config: Config) -> None:
+    # Configs from before the shared catalog hold a full copy of it, with
+    # tracking data stored on the spawns themselves.
+    bosses = config['bosses']
+    tracking = {}
+    for boss, boss_config in bosses.items():
+        for loc, spawn in boss_config['spawns'].items():
+            if 'tod' in spawn:
+                tracking.setdefault(boss, {})[loc] = [
+                    spawn.pop('tod'), spawn.pop('window', 0)
+                ]
+    overlay = {b: c for b, c in bosses.items() if CATALOG.get(b) != c}
+    overlay.update((b, None) for b in CATALOG if b not in bosses)
+    config['bosses'] = overlay
+    config['tracking'] = tracking
+    config['version'] = DEFAULT['version']
+
+
 @client.event
 async def on_message(message: Message) -> None:
-    if message.author == client.user:
+    if message.author == client.user or not is_relevant(message):
         return
-    async with LOCK:
-        try:
-            guild = str(message.guild.id)
-            state = guild_to_state.get(guild) or await init_state(guild)
+    try:
+        guild = str(message.guild.id)
+        state = guild_to_state.get(guild) or await init_state(guild)
+        async with state.lock:
             state.guild = message.guild
             state.last_msg = message
             state.send_time = datetime.timestamp(
@@ -1179,9 +1775,7 @@ async def on_message(message: Message) -> None:
                 elif msg := await state.disambiguate(disamb_idx):
                     await message.channel.send(msg)
                 return
-            cmd = cmd[1:]
-            if cmd == 't' or cmd.startswith('t-'):
-                cmd = f'track{cmd[1:]}'
+            cmd = command_name(cmd)
             if not (fn := CMD_TO_FN.get(cmd)):
                 return
             author = message.author
@@ -1192,14 +1786,13 @@ async def on_message(message: Message) -> None:
                 )
                 return
             resp = await fn(state, args)
-            save()
             if resp:
                 await send_chunked(message.channel, resp)
-        except Exception:
-            print(traceback.format_exc(), file=sys.stderr)
-            await send_chunked(
-                message.channel, f'Error:\n{traceback.format_exc()}'
-            )
+    except Exception:
+        print(traceback.format_exc(), file=sys.stderr)
+        await send_chunked(
+            message.channel, f'Error:\n{traceback.format_exc()}'
+        )
 
 
 @client.event
@@ -1212,15 +1805,44 @@ async def on_disconnect() -> None:
 
 @client.event
 async def on_ready() -> None:
-    async with LOCK:
+    global compact_task
+    if not compact_task:
+        compact_task = asyncio.create_task(compact_journal())
+    if not scheduler.task:
         for state in guild_to_state.values():
-            if not state.auto_refresh_task and state.auto_refresh:
-                state.auto_refresh_task = asyncio.create_task(
-                    state.schedule_refresh()
-                )
+            state.schedule_refresh()
+        scheduler.start()
     print('Ready!', file=sys.stderr)
 
 
+@client.event
+async def on_guild_role_delete(role: Role) -> None:
+    forget_permissions(role.guild)
+
+
+@client.event
+async def on_guild_role_update(before: Role, after: Role) -> None:
+    if before.permissions != after.permissions:
+        forget_permissions(after.guild)
+
+
+@client.event
+async def on_guild_update(before: Guild, after: Guild) -> None:
+    if before.owner_id != after.owner_id:
+        forget_permissions(after)
+
+
+@client.event
+async def on_member_remove(member: Member) -> None:
+    forget_permissions(member.guild, member.id)
+
+
+@client.event
+async def on_member_update(before: Member, after: Member) -> None:
+    if before.roles != after.roles:
+        forget_permissions(after.guild, after.id)
+
+
 async def handle_add(state: State, args: list[str]) -> str:
     def fail(reason: str) -> str:
         return _fail('Failed to add boss', reason)
@@ -1281,7 +1903,7 @@ async def do_add(
             'Failed to add spawn',
             f'{loc} is already the name of a spawn for {boss}'
         )
-    state.spawns(boss)[loc] = config
+    state.add_spawn(boss, loc, config)
     return f'Successfully added spawn for boss: {state.boss_info(boss)}'
 
 
@@ -1298,8 +1920,8 @@ async def handle_add_editor(state: State, args: list[str]) -> str:
         if not mem_id:
             components.append(fail(f'{arg} is not a user mention'))
         else:
-            if mem_id not in state.config['editors']:
-                state.config['editors'].append(mem_id)
+            if mem_id not in state.editors:
+                state.add_editor(mem_id)
                 components.append(f'Successfully added {arg} as an editor')
             else:
                 components.append(fail(f'{arg} is already an editor'))
@@ -1315,9 +1937,11 @@ async def handle_alert(state: State, args: list[str]) -> str:
 
     expr = ' '.join(args)
     try:
-        code = compile(expr, '<string>', 'eval')
-    except Exception:
+        check = compile_alert(expr)
+    except SyntaxError:
         return fail('alert expression could not be compiled')
+    except ValueError as e:
+        return fail(f'alert expression {e}')
 
     test_now = 15
     test_min = 10
@@ -1326,7 +1950,7 @@ async def handle_alert(state: State, args: list[str]) -> str:
 
     try:
         result = state.eval_condition(
-            code,
+            check,
             now=test_now,
             min_time=test_min,
             max_time=test_max,
@@ -1337,7 +1961,7 @@ async def handle_alert(state: State, args: list[str]) -> str:
     if type(result) != bool:
         return fail('alert expression is not a boolean')
 
-    state.add_alert(state.send_time, expr, code)
+    state.add_alert(state.send_time, expr, check)
     return 'Successfully added alert'
 
 
@@ -1370,18 +1994,23 @@ async def handle_auto_refresh(state: State, args: list[str]) -> str:
             f'Tracking information auto-refresh time: {state.auto_refresh_str}'
         )
 
-    if len(args) > 1:
-        return fail('expected at most 1 argument')
+    if len(args) > 2:
+        return fail('expected at most 2 arguments')
 
     if (minutes := int_or_none(args[0])) is None:
         return fail('expected an integer')
 
+    if adaptive := len(args) == 2:
+        if args[1].lower() != 'adaptive':
+            return fail('second argument must be "adaptive"')
+        if not minutes:
+            return fail('adaptive auto-refresh needs a positive time')
+
     state.auto_refresh = minutes
-    if state.auto_refresh_task:
-        state.auto_refresh_task.cancel()
-        state.auto_refresh_task = None
+    if adaptive != state.adaptive_refresh:
+        state.adaptive_refresh = adaptive
+    state.schedule_refresh()
     if minutes:
-        state.auto_refresh_task = asyncio.create_task(state.schedule_refresh())
         return f'Updated auto-refresh time to {state.auto_refresh_str}'
     if not minutes:
         return 'Auto-refresh disabled'
@@ -1415,6 +2044,7 @@ async def handle_cancel(state: State, args: list[str]) -> str:
         if len(spawns) == 1:
             boss, loc = first(spawns)
             if state.cancel(boss, loc):
+                had_success = True
                 components.append(
                     f'Successfully cancelled {state.boss_label(boss, loc)}'
                 )
@@ -1482,7 +2112,7 @@ async def handle_conf(state: State, args: list[str]) -> str:
         f'Server time UTC offset: {state.utc_offset_str}\n\n'
         f'Alerts:{state.alerts_str}\n\n'
         f'Trackable monsters:\n'
-        + '\n'.join(state.boss_info(b) for b in state.boss_set)
+        + '\n'.join(state.boss_info(b) for b in sorted(state.bosses))
         + '\n```'
     )
 
@@ -1662,8 +2292,8 @@ async def do_edit_spawn(
     boss, loc = spawn
     spawn = state.spawns(boss)[loc]
     new_map = new_map or loc
-    new_min = new_min or spawn['min']
-    new_max = new_max or spawn['max']
+    new_min = new_min or spawn.min
+    new_max = new_max or spawn.max
     new_aliases_or_msg = _new_aliases(
         state, boss, new_name, new_aliases, aliases_to_add, aliases_to_remove
     )
@@ -1736,6 +2366,13 @@ async def handle_remove(state: State, args: list[str]) -> str:
     name = args[0]
     bosses = state.resolve(name)
     if not bosses:
+        if options := state.suggestions(name):
+            return state.disambiguation_prompt(
+                f'{name} is not a recognized boss or alias. Did you mean:',
+                options,
+                do_remove,
+                sort=False
+            )
         return fail(f'{name} is not a recognized boss or alias')
     if state.unambiguous(bosses):
         return await do_remove(state, state.first_spawn(bosses))
@@ -1798,7 +2435,7 @@ async def handle_remove_editor(state: State, args: list[str]) -> str:
             components.append(fail(f'{arg} is not an editor'))
         else:
             try:
-                state.config['editors'].remove(mem_id)
+                state.remove_editor(mem_id)
                 components.append(f'Removed {arg} as an editor')
             except ValueError:
                 components.append(
@@ -1807,6 +2444,19 @@ async def handle_remove_editor(state: State, args: list[str]) -> str:
     return '\n'.join(components)
 
 
+async def handle_stats(state: State, args: list[str]) -> str:
+    preamble = 'Note: arguments ignored\n' if args else ''
+    return (
+        f'```\n{preamble}'
+        f'Servers scheduled to refresh: {scheduler.depth}\n'
+        f'Servers in last refresh batch: {scheduler.last_batch}\n'
+        f'Last refresh batch ran {scheduler.lag:.1f}s late\n'
+        f'Choice prompts: {cache_stats(state.disamb)}\n'
+        f'Permission checks: {cache_stats(state.managers)}\n'
+        '```'
+    )
+
+
 async def handle_track(state: State, args: list[str]) -> str:
     def fail(reason: str) -> str:
         return _fail('Failed to track boss', reason)
@@ -1855,11 +2505,18 @@ async def handle_track(state: State, args: list[str]) -> str:
     name = ' '.join(args[:name_end])
 
     bosses = state.resolve(name)
+    tod = tod or state.send_time
     if not bosses:
+        if options := state.suggestions(name):
+            return state.disambiguation_prompt(
+                f'{name} is not a recognized boss or alias. Did you mean:',
+                options,
+                do_track,
+                (tod, window, True),
+                sort=False
+            )
         return fail(f'{name} is not a recognized boss or alias')
 
-    tod = tod or state.send_time
-
     if state.unambiguous(bosses):
         if disamb_idxs:
             return fail(f'{name} is already unambiguous')
@@ -1974,6 +2631,7 @@ CMD_TO_FN = {
     'track-remove': handle_remove,
     'track-remove-alert': handle_remove_alert,
     'track-remove-editor': handle_remove_editor,
+    'track-stats': handle_stats,
     'track-utc-offset': handle_utc_offset
 }
 
@@ -1995,16 +2653,18 @@ NEEDS_EDITOR = {
 
 def main() -> None:
     global global_config
-    if not os.path.exists(CONF):
-        with open(CONF, 'w') as f:
-            json.dump({}, f)
-    with open(CONF, 'r') as f:
-        global_config = json.load(f)
+    global_config = store.load(CONF)
 
     for guild, config in global_config.items():
-        load_state(guild, State(config), False)
+        if 'version' not in config:
+            upgrade_config(config)
+            store.record(guild, 'set', [], config)
+        load_state(guild, State(guild, config))
 
-    client.run(os.environ['DISCORD_TOKEN'])
+    try:
+        client.run(os.environ['DISCORD_TOKEN'])
+    finally:
+        store.close(global_config)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,64 @@
+from __future__ import annotations
+
+import time
+from collections import OrderedDict
+from typing import Generic, TypeVar
+
+K = TypeVar('K')
+V = TypeVar('V')
+
+
+class TTLCache(Generic[K, V]):
+    # Oldest first. Every entry lives for the same ttl, so this is also the
+    # order they expire in.
+    entries: OrderedDict[K, tuple[float, V]]
+    evicted: int
+    expired: int
+    hits: int
+    max_size: int
+    misses: int
+    ttl: float
+
+    def __init__(self, ttl: float, max_size: int) -> None:
+        self.entries = OrderedDict()
+        self.evicted = 0
+        self.expired = 0
+        self.hits = 0
+        self.max_size = max_size
+        self.misses = 0
+        self.ttl = ttl
+
+    def __contains__(self, key: K) -> bool:
+        self.expire()
+        return key in self.entries
+
+    def __delitem__(self, key: K) -> None:
+        del self.entries[key]
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __setitem__(self, key: K, value: V) -> None:
+        self.expire()
+        self.entries.pop(key, None)
+        self.entries[key] = time.monotonic() + self.ttl, value
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+            self.evicted += 1
+
+    def clear(self) -> None:
+        self.entries.clear()
+
+    def expire(self) -> None:
+        now = time.monotonic()
+        while self.entries and next(iter(self.entries.values()))[0] <= now:
+            self.entries.popitem(last=False)
+            self.expired += 1
+
+    def get(self, key: K) -> V | None:
+        self.expire()
+        if (entry := self.entries.get(key)) is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry[1]